@@ -1,52 +1,28 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
+import sys
+import os
 import plotly.express as px
 import plotly.graph_objects as go
 
-# Funções de formatação brasileira
-def formatar_moeda_br(valor):
-    """Formata valor monetário no padrão brasileiro: R$ 1.234.567,89"""
-    try:
-        if pd.isna(valor) or valor == '' or valor is None:
-            return "N/A"
-        
-        valor_float = float(valor)
-        valor_str = f"{valor_float:,.2f}"
-        partes = valor_str.split('.')
-        parte_inteira = partes[0].replace(',', '.')
-        parte_decimal = partes[1] if len(partes) > 1 else '00'
-        return f"R$ {parte_inteira},{parte_decimal}"
-    except:
-        return "N/A"
+# Adicionar o diretório raiz ao path para importar os utilitários
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def formatar_numero_br(valor):
-    """Formata número no padrão brasileiro: 1.234.567"""
-    try:
-        if pd.isna(valor) or valor == '' or valor is None:
-            return "N/A"
-        
-        valor_int = int(float(valor))
-        return f"{valor_int:,}".replace(',', '.')
-    except:
-        return "N/A"
+from utils.repository import load_rds, load_chart, watermark_atual
 
 st.set_page_config(page_title="Visualização de Gráficos", page_icon="📈")
 st.title("📈 Visualização de Gráficos")
 
-# Conexão com o banco de dados
-conn = sqlite3.connect("relatorios.db")
+# Uma consulta mínima por rerun: os dados só são relidos se houve ingestão nova
+watermark = watermark_atual()
 
 # Gráficos RDS
 st.subheader("💰 Análise de Vendas RDS")
 
 try:
-    rds = pd.read_sql_query("SELECT * FROM rds_vendas ORDER BY data", conn)
+    rds = load_rds(watermark=watermark)
     
     if not rds.empty:
-        # Converter data para formato datetime
-        rds['data_dt'] = pd.to_datetime(rds['data'], format='%d/%m/%Y', errors='coerce')
-        
         # Gráfico de Faturamento por Data
         st.subheader("📊 Faturamento por Data")
         fig_faturamento = px.line(
@@ -130,21 +106,21 @@ except Exception as e:
 st.subheader("🏢 Análise de Principais Clientes ou OTA/AGÊNCIAS")
 
 try:
-    chart = pd.read_sql_query("SELECT * FROM chart_compradores ORDER BY valor DESC", conn)
+    chart = load_chart(watermark=watermark)
     
     if not chart.empty:
         # Top 10 Principais Clientes
         st.subheader("🏆 Top 10 Principais Clientes ou OTA/AGÊNCIAS por Volume")
-        top10_compradores = chart.groupby('comprador')['valor'].sum().nlargest(10).reset_index()
+        top10_compradores = chart.groupby('comprador')['total_reservas'].sum().nlargest(10).reset_index()
         
         fig_top10 = px.bar(
             top10_compradores, 
-            x='valor', 
+            x='total_reservas', 
             y='comprador', 
             orientation='h',
             title='Top 10 Principais Clientes ou OTA/AGÊNCIAS por Total de Reservas',
-            labels={'valor': 'Total de Reservas', 'comprador': 'Cliente/OTA'},
-            color='valor',
+            labels={'total_reservas': 'Total de Reservas', 'comprador': 'Cliente/OTA'},
+            color='total_reservas',
             color_continuous_scale='Viridis'
         )
         fig_top10.update_layout(
@@ -158,16 +134,16 @@ try:
         
         # Distribuição de Reservas por Data
         st.subheader("📅 Distribuição de Reservas por Data")
-        reservas_por_data = chart.groupby('data')['valor'].sum().reset_index()
+        reservas_por_data = chart.groupby('data')['total_reservas'].sum().reset_index()
         reservas_por_data['data_dt'] = pd.to_datetime(reservas_por_data['data'], format='%d/%m/%Y', errors='coerce')
         
         fig_dist = px.bar(
             reservas_por_data, 
             x='data_dt', 
-            y='valor', 
+            y='total_reservas', 
             title='Total de Reservas por Data',
-            labels={'data_dt': 'Data', 'valor': 'Total de Reservas'},
-            color='valor',
+            labels={'data_dt': 'Data', 'total_reservas': 'Total de Reservas'},
+            color='total_reservas',
             color_continuous_scale='Oranges'
         )
         fig_dist.update_layout(
@@ -180,11 +156,11 @@ try:
         
         # Gráfico de Pizza - Top 5 Principais Clientes
         st.subheader("🥧 Participação dos Top 5 Principais Clientes ou OTA/AGÊNCIAS")
-        top5_compradores = chart.groupby('comprador')['valor'].sum().nlargest(5).reset_index()
+        top5_compradores = chart.groupby('comprador')['total_reservas'].sum().nlargest(5).reset_index()
         
         fig_pizza = px.pie(
             top5_compradores, 
-            values='valor', 
+            values='total_reservas', 
             names='comprador', 
             title='Participação dos Top 5 Principais Clientes ou OTA/AGÊNCIAS no Total de Reservas'
         )
@@ -209,7 +185,7 @@ try:
     }).reset_index()
     
     chart_resumo = chart.groupby('data').agg({
-        'valor': 'sum'
+        'total_reservas': 'sum'
     }).reset_index()
     
     # Merge dos dados com tratamento de valores nulos
@@ -217,7 +193,7 @@ try:
     
     # Preencher valores nulos com 0 para evitar gaps no gráfico
     comparativo['valor_total'] = comparativo['valor_total'].fillna(0)
-    comparativo['valor'] = comparativo['valor'].fillna(0)
+    comparativo['total_reservas'] = comparativo['total_reservas'].fillna(0)
     
     # Converter data e ordenar
     comparativo['data_dt'] = pd.to_datetime(comparativo['data'], format='%d/%m/%Y', errors='coerce')
@@ -229,8 +205,8 @@ try:
         dias_sem_rds = comparativo[comparativo['valor_total'] == 0]['data'].tolist()
         dados_faltantes.append(f"📊 RDS faltante: {', '.join(dias_sem_rds)}")
     
-    if comparativo['valor'].eq(0).any():
-        dias_sem_chart = comparativo[comparativo['valor'] == 0]['data'].tolist()
+    if comparativo['total_reservas'].eq(0).any():
+        dias_sem_chart = comparativo[comparativo['total_reservas'] == 0]['data'].tolist()
         dados_faltantes.append(f"📈 Chart faltante: {', '.join(dias_sem_chart)}")
     
     if dados_faltantes:
@@ -252,10 +228,10 @@ try:
     ))
     
     # Linha Chart - remover pontos com valor 0
-    chart_data = comparativo[comparativo['valor'] > 0]
+    chart_data = comparativo[comparativo['total_reservas'] > 0]
     fig_comparativo.add_trace(go.Scatter(
         x=chart_data['data_dt'], 
-        y=chart_data['valor'],
+        y=chart_data['total_reservas'],
         mode='lines+markers',
         name='Total Reservas Chart',
         line=dict(color='red', width=3),
@@ -276,5 +252,3 @@ try:
     
 except Exception as e:
     st.error(f"Erro ao criar gráfico comparativo: {str(e)}")
-
-conn.close()
@@ -0,0 +1,71 @@
+"""
+Classificação dos compradores (dimensão compradores)
+Projeto: relatorioAram
+
+Cada nome de comprador do Chart é normalizado e classificado uma única vez,
+na ingestão; as tabelas do Chart guardam apenas o id (comprador_id).
+"""
+
+import re
+import unicodedata
+from typing import Dict, Optional
+
+CATEGORIA_OTA = 'ota'
+CATEGORIA_INTERNO = 'interno'
+CATEGORIA_EVENTO = 'evento'
+CATEGORIA_AGENCIA = 'agencia'
+
+# Categorias somadas no painel de vendas internas do hotel
+CATEGORIAS_VENDAS_INTERNAS = (CATEGORIA_INTERNO, CATEGORIA_EVENTO)
+
+# Regras em ordem de prioridade: trecho do nome normalizado -> (categoria, rótulo)
+# Rótulo None mantém o nome original do relatório
+REGRAS_COMPRADORES = [
+    ('MOTOR DE RESERVAS', CATEGORIA_INTERNO, '🌐 Site do Hotel'),
+    ('EVENTOS IMIRA', CATEGORIA_EVENTO, '🎉 Eventos Imira Plaza'),
+    ('PARTICULAR', CATEGORIA_INTERNO, None),
+]
+
+# Nomes exatos com rótulo próprio
+ROTULOS_EXATOS = {
+    'PARTICULAR': '👤 Particular',
+}
+
+# Agências online conhecidas; demais compradores externos são agências
+OTAS_CONHECIDAS = (
+    'BOOKING', 'EXPEDIA', 'DECOLAR', 'HOTELS.COM', 'HOTELBEDS',
+    'AIRBNB', 'HURB', 'TRIVAGO', 'AGODA', 'TRIP.COM', '123MILHAS', '123 MILHAS',
+)
+
+def normalizar_comprador(nome: str) -> str:
+    """Maiúsculas, sem acentos e com espaços simples ('Booking.com ' == 'BOOKING.COM')"""
+    texto = unicodedata.normalize('NFKD', str(nome or '').upper())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto).strip()
+
+def classificar_comprador(nome: str) -> Dict[str, str]:
+    """
+    Classifica um comprador pelo nome
+
+    Returns:
+        dict: nome, nome_normalizado, categoria e rotulo (texto de exibição)
+    """
+    normalizado = normalizar_comprador(nome)
+    categoria: Optional[str] = None
+    rotulo: Optional[str] = ROTULOS_EXATOS.get(normalizado)
+
+    for trecho, categoria_regra, rotulo_regra in REGRAS_COMPRADORES:
+        if trecho in normalizado:
+            categoria = categoria_regra
+            rotulo = rotulo or rotulo_regra
+            break
+
+    if categoria is None:
+        categoria = CATEGORIA_OTA if any(ota in normalizado for ota in OTAS_CONHECIDAS) else CATEGORIA_AGENCIA
+
+    return {
+        'nome': str(nome).strip(),
+        'nome_normalizado': normalizado,
+        'categoria': categoria,
+        'rotulo': rotulo or str(nome).strip(),
+    }
@@ -4,72 +4,210 @@ Projeto: relatorioAram
 """
 
 import os
+import re
+import queue
+import logging
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 import pandas as pd
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 import streamlit as st
 
+from utils.compradores import classificar_comprador, normalizar_comprador
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
-def get_database_connection():
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'relatorios.db'
+MAX_CONEXOES_SQLITE_OCIOSAS = 8
+
+class GerenciadorConexoes:
     """
-    Conecta ao banco de dados - SQLite (local) para desenvolvimento
-    Supabase será usado apenas em produção
+    Mantém conexões de longa duração com o banco de dados
+    - SQLite: pool de conexões reaproveitadas entre queries e threads
+      (cada conexão é usada por uma thread de cada vez)
+    - Supabase: um único cliente compartilhado, verificado apenas na criação
     """
-    # Para desenvolvimento, sempre usar SQLite local
-    if os.path.exists('relatorios.db'):
-        return {"type": "sqlite", "client": sqlite3.connect('relatorios.db')}
-    
-    # Se não existir o arquivo SQLite, tentar Supabase como fallback
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_ANON_KEY")
-    
-    if supabase_url and supabase_key:
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._sqlite_livres = queue.LifoQueue(maxsize=MAX_CONEXOES_SQLITE_OCIOSAS)
+        self._supabase_client = None
+        self._tipo = None
+        self._estatisticas = {
+            "sqlite_abertas": 0,
+            "sqlite_reutilizadas": 0,
+            "supabase_criados": 0,
+            "supabase_reutilizados": 0,
+        }
+
+    def _contar(self, chave: str):
+        with self._lock:
+            self._estatisticas[chave] += 1
+
+    def estatisticas(self) -> dict:
+        """Retorna cópia dos contadores de conexões abertas vs. reutilizadas"""
+        with self._lock:
+            return dict(self._estatisticas)
+
+    def tipo(self) -> str:
+        """Decide o backend uma única vez por processo"""
+        if self._tipo is None:
+            with self._lock:
+                if self._tipo is None:
+                    self._tipo = self._detectar_tipo()
+        return self._tipo
+
+    def _detectar_tipo(self) -> str:
+        # Para desenvolvimento, sempre usar SQLite local
+        if os.path.exists(self.db_path):
+            return "sqlite"
+
+        # Se não existir o arquivo SQLite, tentar Supabase como fallback
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_ANON_KEY")
+
+        if not (supabase_url and supabase_key):
+            # Criar SQLite local se não existir
+            return "sqlite"
+
         try:
             from supabase import create_client
             client = create_client(supabase_url, supabase_key)
-            # Testar se as tabelas existem
-            result = client.table('rds_vendas').select("*").limit(1).execute()
-            return {"type": "supabase", "client": client}
+            # Testar se as tabelas existem (apenas na criação do cliente)
+            client.table('rds_vendas').select("data").limit(1).execute()
         except ImportError:
             st.warning("⚠️ Supabase não instalado, criando SQLite local")
-            return {"type": "sqlite", "client": sqlite3.connect('relatorios.db')}
-        except Exception as e:
+            return "sqlite"
+        except Exception:
             st.info("ℹ️ Usando banco SQLite local (tabelas Supabase não criadas ainda)")
-            return {"type": "sqlite", "client": sqlite3.connect('relatorios.db')}
-    else:
-        # Criar SQLite local se não existir
-        return {"type": "sqlite", "client": sqlite3.connect('relatorios.db')}
+            return "sqlite"
+
+        self._supabase_client = client
+        self._estatisticas["supabase_criados"] += 1
+        return "supabase"
+
+    def supabase(self):
+        """Retorna o cliente Supabase compartilhado, recriando-o se descartado"""
+        with self._lock:
+            if self._supabase_client is not None:
+                self._estatisticas["supabase_reutilizados"] += 1
+                return self._supabase_client
+
+            from supabase import create_client
+            self._supabase_client = create_client(
+                os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_ANON_KEY")
+            )
+            self._estatisticas["supabase_criados"] += 1
+            return self._supabase_client
+
+    def descartar_supabase(self):
+        """Descarta o cliente após uma falha; o próximo uso cria um novo"""
+        with self._lock:
+            self._supabase_client = None
+
+    @contextmanager
+    def sqlite(self):
+        """Empresta uma conexão SQLite do pool e a devolve ao final"""
+        try:
+            conn = self._sqlite_livres.get_nowait()
+            self._contar("sqlite_reutilizadas")
+        except queue.Empty:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._contar("sqlite_abertas")
+
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            try:
+                self._sqlite_livres.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def conexao(self):
+        """Fornece {"type", "client"} para o backend ativo"""
+        if self.tipo() == "supabase":
+            try:
+                yield {"type": "supabase", "client": self.supabase()}
+            except Exception as e:
+                # Erro devolvido pelo PostgREST (SQL, função ausente...): o cliente segue válido
+                from postgrest.exceptions import APIError
+                if not isinstance(e, APIError):
+                    self.descartar_supabase()
+                raise
+        else:
+            with self.sqlite() as conn:
+                yield {"type": "sqlite", "client": conn}
+
+@st.cache_resource
+def get_gerenciador_conexoes() -> GerenciadorConexoes:
+    """
+    Gerenciador de conexões único por processo (compartilhado entre sessões)
+    """
+    gerenciador = GerenciadorConexoes()
+    if gerenciador.tipo() == "sqlite" and os.path.exists(gerenciador.db_path):
+        # Só o que não altera dados; o resto fica para migrar_esquema
+        try:
+            verificar_esquema(gerenciador)
+        except Exception as e:
+            # Esquema inesperado não pode impedir as consultas que ainda funcionam
+            logger.error(f"❌ Verificação do esquema falhou: {str(e)}")
+    return gerenciador
+
+def get_database_connection():
+    """
+    Conecta ao banco de dados - SQLite (local) para desenvolvimento
+    Supabase será usado apenas em produção
+
+    Uso: with get_database_connection() as db_conn: ...
+    A conexão volta ao pool ao sair do bloco (não deve ser fechada).
+    """
+    return get_gerenciador_conexoes().conexao()
+
+def get_connection_stats() -> dict:
+    """
+    Contadores de conexões abertas vs. reutilizadas desde o início do processo
+    """
+    return get_gerenciador_conexoes().estatisticas()
 
 def execute_query(query: str, params: Optional[tuple] = None) -> pd.DataFrame:
     """
     Executa query SQL e retorna DataFrame
     Compatível com Supabase e SQLite
     """
-    db_conn = get_database_connection()
-    
     try:
-        if db_conn["type"] == "supabase":
-            # Para Supabase, converter SQL para PostgREST
-            return execute_supabase_query(db_conn["client"], query, params)
-        else:
-            # SQLite tradicional
-            if params:
-                return pd.read_sql_query(query, db_conn["client"], params=params)
+        with get_database_connection() as db_conn:
+            if db_conn["type"] == "supabase":
+                # Para Supabase, converter SQL para PostgREST
+                return execute_supabase_query(db_conn["client"], query, params)
             else:
-                return pd.read_sql_query(query, db_conn["client"])
+                # SQLite tradicional
+                if params:
+                    return pd.read_sql_query(query, db_conn["client"], params=params)
+                else:
+                    return pd.read_sql_query(query, db_conn["client"])
     except Exception as e:
         st.error(f"❌ Erro na query: {str(e)}")
         return pd.DataFrame()
-    finally:
-        if db_conn["type"] == "sqlite":
-            db_conn["client"].close()
 
 def execute_supabase_query(client, query: str, params: Optional[tuple] = None) -> pd.DataFrame:
     """
-    Converte queries SQL para Supabase PostgREST
+    Executa SQL bruto no Supabase carregando a tabela e filtrando em memória
+
+    Caminho de compatibilidade: prefira consultar(), que empurra projeção,
+    filtros, ordenação, limite e agregados para o PostgREST.
     """
     # Determinar tabela principal da query
     query_lower = query.lower().strip()
@@ -87,10 +225,10 @@ def execute_supabase_query(client, query: str, params: Optional[tuple] = None) -
     else:
         raise ValueError(f"Tabela não identificada na query: {query}")
     
-    # Executar query básica (pode ser expandida conforme necessário)
+    _registrar_fallback(f"SQL bruto em {table}")
+
     try:
-        result = client.table(table).select("*").execute()
-        df = pd.DataFrame(result.data)
+        df = carregar_tabela_supabase(client, table)
         
         # Aplicar filtros se necessário
         if params and "WHERE data =" in query:
@@ -100,58 +238,1338 @@ def execute_supabase_query(client, query: str, params: Optional[tuple] = None) -
         return df
     
     except Exception as e:
+        get_gerenciador_conexoes().descartar_supabase()
         st.error(f"❌ Erro na query Supabase: {str(e)}")
         return pd.DataFrame()
 
-def insert_data(table: str, data: dict) -> bool:
+OPERADORES_SQL = {
+    "eq": "=",
+    "neq": "!=",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "like": "LIKE",
+}
+
+FUNCOES_AGREGADAS = ("sum", "avg", "count", "min", "max")
+
+# Limite padrão de linhas por resposta do PostgREST (max-rows)
+TAMANHO_PAGINA_SUPABASE = 1000
+
+_IDENTIFICADOR = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_estatisticas_pushdown = {"pushdown": 0, "fallback_memoria": 0}
+
+def _validar_identificador(nome: str) -> str:
+    """Aceita apenas nomes simples de tabela/coluna (evita injeção de SQL)"""
+    if not _IDENTIFICADOR.match(nome):
+        raise ValueError(f"Identificador inválido: {nome}")
+    return nome
+
+def _registrar_fallback(motivo: str):
+    """Conta e reporta consultas resolvidas em memória em vez do banco"""
+    _estatisticas_pushdown["fallback_memoria"] += 1
+    logger.warning(f"⚠️ Consulta resolvida em memória (sem pushdown): {motivo}")
+
+def get_pushdown_stats() -> dict:
     """
-    Insere dados na tabela especificada
+    Quantas consultas foram resolvidas no banco vs. em memória
     """
-    db_conn = get_database_connection()
-    
+    return dict(_estatisticas_pushdown)
+
+def _montar_sql(
+    tabela: str,
+    colunas: Optional[List[str]],
+    filtros: List[tuple],
+    agregados: Dict[str, tuple],
+    agrupar_por: List[str],
+    ordenar_por: List[tuple],
+    limite: Optional[int],
+) -> Tuple[str, tuple]:
+    """Gera SQL parametrizado equivalente à especificação da consulta"""
+    selecao = [_validar_identificador(c) for c in agrupar_por or colunas or []]
+    for alias, (funcao, coluna) in agregados.items():
+        alvo = "*" if coluna == "*" else _validar_identificador(coluna)
+        selecao.append(f"{funcao.upper()}({alvo}) AS {_validar_identificador(alias)}")
+
+    sql = f"SELECT {', '.join(selecao) or '*'} FROM {_validar_identificador(tabela)}"
+    params = []
+
+    condicoes = []
+    for coluna, operador, valor in filtros:
+        coluna = _validar_identificador(coluna)
+        if operador == "in":
+            condicoes.append(f"{coluna} IN ({','.join('?' for _ in valor)})")
+            params.extend(valor)
+        elif operador == "like_any":
+            condicoes.append("(" + " OR ".join(f"{coluna} LIKE ?" for _ in valor) + ")")
+            params.extend(valor)
+        else:
+            condicoes.append(f"{coluna} {OPERADORES_SQL[operador]} ?")
+            params.append(valor)
+    if condicoes:
+        sql += " WHERE " + " AND ".join(condicoes)
+
+    if agrupar_por:
+        sql += " GROUP BY " + ", ".join(agrupar_por)
+    if ordenar_por:
+        sql += " ORDER BY " + ", ".join(
+            f"{_validar_identificador(c)} {'DESC' if desc else 'ASC'}" for c, desc in ordenar_por
+        )
+    if limite is not None:
+        sql += f" LIMIT {int(limite)}"
+
+    return sql, tuple(params)
+
+def _aplicar_filtros_postgrest(consulta, filtros: List[tuple]):
+    """Traduz os filtros para os métodos do construtor PostgREST"""
+    for coluna, operador, valor in filtros:
+        if operador == "in":
+            consulta = consulta.in_(coluna, list(valor))
+        elif operador == "like_any":
+            padroes = ",".join(f'{coluna}.like."{p.replace("%", "*")}"' for p in valor)
+            consulta = consulta.or_(padroes)
+        else:
+            consulta = getattr(consulta, operador)(coluna, valor)
+    return consulta
+
+def _agregar_em_memoria(df: pd.DataFrame, agregados: Dict[str, tuple], agrupar_por: List[str]) -> pd.DataFrame:
+    """Calcula os agregados com pandas (usado apenas no fallback)"""
+    funcoes = {"sum": "sum", "avg": "mean", "count": "count", "min": "min", "max": "max"}
+
+    if agrupar_por:
+        grupos = df.groupby(agrupar_por, dropna=False)
+        resultado = pd.DataFrame({
+            alias: grupos.size() if coluna == "*" else grupos[coluna].agg(funcoes[funcao])
+            for alias, (funcao, coluna) in agregados.items()
+        }).reset_index()
+        return resultado
+
+    linha = {
+        alias: len(df) if coluna == "*" else getattr(df[coluna], funcoes[funcao])()
+        for alias, (funcao, coluna) in agregados.items()
+    }
+    return pd.DataFrame([linha])
+
+def _ordenar_limitar(df: pd.DataFrame, ordenar_por: List[tuple], limite: Optional[int]) -> pd.DataFrame:
+    """Ordenação/limite em memória sobre um resultado já reduzido"""
+    if ordenar_por and not df.empty:
+        df = df.sort_values(
+            [c for c, _ in ordenar_por], ascending=[not desc for _, desc in ordenar_por]
+        )
+    if limite is not None:
+        df = df.head(limite)
+    return df.reset_index(drop=True)
+
+def _desempate_paginacao(tabela: str) -> List[str]:
+    """
+    Colunas que tornam a ordem total (e única) para a paginação por Range:
+    a chave primária `id` se existir, senão a chave natural (CHAVES_NATURAIS)
+    """
+    colunas = colunas_tabela(tabela)
+    if 'id' in colunas:
+        return ['id']
+    if tabela in CHAVES_NATURAIS:
+        return list(CHAVES_NATURAIS[tabela])
+    logger.warning(f"⚠️ {tabela} sem chave única conhecida: páginas podem se sobrepor")
+    return []
+
+def iterar_paginas_supabase(
+    client,
+    tabela: str,
+    colunas: str = "*",
+    filtros: Optional[List[tuple]] = None,
+    ordenar_por: Optional[List[tuple]] = None,
+    tamanho_pagina: int = TAMANHO_PAGINA_SUPABASE,
+    prefetch: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """
+    Lê uma tabela do Supabase em páginas (Range), gerando um DataFrame por página
+
+    O PostgREST limita cada resposta (max-rows, normalmente 1000 linhas), então
+    um select único trunca tabelas grandes. Aqui o deslocamento avança pelo
+    número de linhas efetivamente recebidas até uma página vazia, o que funciona
+    mesmo se o servidor devolver menos linhas que tamanho_pagina.
+
+    Args:
+        colunas (str): Projeção PostgREST (ex.: "data,valor_total")
+        filtros (list): Mesmo formato de consultar()
+        ordenar_por (list): Tuplas (coluna, decrescente); a chave única da
+            tabela (_desempate_paginacao) é sempre acrescentada ao final, para
+            que páginas não se sobreponham nem pulem linhas empatadas
+        tamanho_pagina (int): Linhas solicitadas por requisição
+        prefetch (bool): Busca a próxima página em segundo plano enquanto a
+            atual é processada pelo chamador
+    """
+    filtros = filtros or []
+    ordenar_por = list(ordenar_por or [])
+    ordenadas = {coluna for coluna, _ in ordenar_por}
+    ordenar_por += [(c, False) for c in _desempate_paginacao(tabela) if c not in ordenadas]
+
+    def buscar(inicio: int) -> list:
+        consulta = _aplicar_filtros_postgrest(client.table(tabela).select(colunas), filtros)
+        for coluna, desc in ordenar_por:
+            consulta = consulta.order(coluna, desc=desc)
+        return consulta.range(inicio, inicio + tamanho_pagina - 1).execute().data
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        inicio = 0
+        pendente = executor.submit(buscar, inicio) if prefetch else None
+
+        while True:
+            dados = pendente.result() if prefetch else buscar(inicio)
+            if not dados:
+                return
+
+            inicio += len(dados)
+            if prefetch:
+                pendente = executor.submit(buscar, inicio)
+
+            yield pd.DataFrame(dados)
+            del dados
+
+def carregar_tabela_supabase(client, tabela: str, **kwargs) -> pd.DataFrame:
+    """
+    Concatena todas as páginas de iterar_paginas_supabase() em um único DataFrame
+    """
+    paginas = list(iterar_paginas_supabase(client, tabela, **kwargs))
+    if not paginas:
+        return pd.DataFrame()
+    return pd.concat(paginas, ignore_index=True)
+
+def _consultar_supabase(
+    client,
+    tabela: str,
+    colunas: Optional[List[str]],
+    filtros: List[tuple],
+    agregados: Dict[str, tuple],
+    agrupar_por: List[str],
+    ordenar_por: List[tuple],
+    limite: Optional[int],
+) -> pd.DataFrame:
+    """Executa a consulta no PostgREST, empurrando o máximo possível ao servidor"""
+    if not agregados:
+        projecao = ",".join(colunas) if colunas else "*"
+        _estatisticas_pushdown["pushdown"] += 1
+
+        if limite is not None and limite <= TAMANHO_PAGINA_SUPABASE:
+            consulta = _aplicar_filtros_postgrest(client.table(tabela).select(projecao), filtros)
+            for coluna, desc in ordenar_por:
+                consulta = consulta.order(coluna, desc=desc)
+            return pd.DataFrame(consulta.limit(limite).execute().data)
+
+        # Resultado pode passar do max-rows: paginar para não truncar
+        df = carregar_tabela_supabase(
+            client, tabela, colunas=projecao, filtros=filtros, ordenar_por=ordenar_por
+        )
+        return df.head(limite) if limite is not None else df
+
+    # Agregados do PostgREST: "alias:coluna.sum()"; colunas não agregadas viram GROUP BY
+    selecao = list(agrupar_por)
+    for alias, (funcao, coluna) in agregados.items():
+        selecao.append(f"{alias}:count()" if coluna == "*" else f"{alias}:{coluna}.{funcao}()")
+
     try:
-        if db_conn["type"] == "supabase":
-            result = db_conn["client"].table(table).insert(data).execute()
-            return len(result.data) > 0
+        consulta = _aplicar_filtros_postgrest(client.table(tabela).select(",".join(selecao)), filtros)
+        df = pd.DataFrame(consulta.execute().data)
+        _estatisticas_pushdown["pushdown"] += 1
+    except Exception as e:
+        # Agregados desabilitados no projeto (pgrst.db_aggregates_enabled):
+        # ainda empurra projeção e filtros, agrega localmente
+        _registrar_fallback(f"agregados em {tabela} ({str(e)})")
+        necessarias = sorted({c for _, c in agregados.values() if c != "*"} | set(agrupar_por))
+        linhas = carregar_tabela_supabase(
+            client, tabela, colunas=",".join(necessarias) or "*", filtros=filtros
+        )
+        if linhas.empty:
+            linhas = pd.DataFrame(columns=necessarias)
+        df = _agregar_em_memoria(linhas, agregados, agrupar_por)
+
+    # PostgREST não ordena por agregados; o resultado já está reduzido aos grupos
+    return _ordenar_limitar(df, ordenar_por, limite)
+
+def consultar(
+    tabela: str,
+    colunas: Optional[List[str]] = None,
+    filtros: Optional[List[tuple]] = None,
+    agregados: Optional[Dict[str, tuple]] = None,
+    agrupar_por: Optional[List[str]] = None,
+    ordenar_por: Optional[List[tuple]] = None,
+    limite: Optional[int] = None,
+    exibir_erro: bool = True,
+    levantar_erro: bool = False,
+) -> pd.DataFrame:
+    """
+    Consulta estruturada executada no banco (SQLite ou Supabase)
+
+    Args:
+        tabela (str): Nome da tabela
+        colunas (list): Colunas a retornar (padrão: todas)
+        filtros (list): Tuplas (coluna, operador, valor) combinadas com AND.
+            Operadores: eq, neq, gt, gte, lt, lte, like, in, like_any
+        agregados (dict): alias -> (funcao, coluna), funcao em sum/avg/count/min/max
+            (use coluna "*" com count para contar linhas)
+        agrupar_por (list): Colunas de agrupamento
+        ordenar_por (list): Tuplas (coluna, decrescente)
+        limite (int): Máximo de linhas
+        exibir_erro (bool): Mostra st.error em caso de falha (sempre retorna
+            DataFrame vazio)
+        levantar_erro (bool): Propaga a exceção em vez de retornar DataFrame
+            vazio (para loaders cacheados não guardarem a falha)
+
+    O volume transferido acompanha o tamanho da resposta, não da tabela.
+    """
+    filtros = filtros or []
+    agregados = agregados or {}
+    agrupar_por = agrupar_por or []
+    ordenar_por = ordenar_por or []
+
+    for _, operador, _ in filtros:
+        if operador not in OPERADORES_SQL and operador not in ("in", "like_any"):
+            raise ValueError(f"Operador não suportado: {operador}")
+    for funcao, _ in agregados.values():
+        if funcao not in FUNCOES_AGREGADAS:
+            raise ValueError(f"Função agregada não suportada: {funcao}")
+
+    try:
+        with get_database_connection() as db_conn:
+            if db_conn["type"] == "supabase":
+                return _consultar_supabase(
+                    db_conn["client"], tabela, colunas, filtros,
+                    agregados, agrupar_por, ordenar_por, limite
+                )
+
+            sql, params = _montar_sql(
+                tabela, colunas, filtros, agregados, agrupar_por, ordenar_por, limite
+            )
+            _estatisticas_pushdown["pushdown"] += 1
+            return pd.read_sql_query(sql, db_conn["client"], params=params)
+    except Exception as e:
+        if levantar_erro:
+            raise
+        if exibir_erro:
+            st.error(f"❌ Erro na consulta a {tabela}: {str(e)}")
         else:
-            # SQLite
-            conn = db_conn["client"]
-            columns = list(data.keys())
-            values = list(data.values())
-            placeholders = ','.join(['?' for _ in values])
-            
-            query = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})"
-            cursor = conn.cursor()
-            cursor.execute(query, values)
-            conn.commit()
-            return True
-    
+            logger.info(f"ℹ️ Consulta a {tabela} falhou: {str(e)}")
+        return pd.DataFrame()
+
+# Registro do esquema: tabelas e colunas inspecionadas uma vez por processo
+# (e de novo quando o watermark informado muda ou após migrar_esquema)
+_esquema = {"tabelas": None, "watermark": None}
+_trava_esquema = threading.RLock()  # a primeira conexão pode migrar (e invalidar) o esquema
+
+def _inspecionar_sqlite(conn) -> Dict[str, List[str]]:
+    nomes = [
+        linha[0] for linha in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'"
+        )
+    ]
+    return {nome: _colunas_sqlite(conn, nome) for nome in nomes}
+
+def _inspecionar_supabase(client) -> Dict[str, List[str]]:
+    """Tabelas expostas pelo PostgREST, lidas da especificação OpenAPI da raiz da API"""
+    resposta = client.postgrest.session.get("/")
+    resposta.raise_for_status()
+    definicoes = resposta.json().get("definitions", {})
+    return {nome: list(d.get("properties", {}).keys()) for nome, d in definicoes.items()}
+
+def esquema_banco(watermark: Optional[int] = None) -> Dict[str, List[str]]:
+    """
+    Tabelas do banco ativo -> colunas, em cache no processo
+
+    Args:
+        watermark (int): Lote de ingestão atual; se diferente do usado na
+            última inspeção, o esquema é relido (tabelas criadas por outra
+            ingestão passam a ser vistas)
+
+    Raises:
+        Exception: Se a inspeção falhar (esquema desconhecido não é o mesmo
+            que "sem tabelas"; nada fica em cache)
+    """
+    with _trava_esquema:
+        atual = _esquema["tabelas"] is not None and (
+            watermark is None or watermark == _esquema["watermark"]
+        )
+        if atual:
+            return _esquema["tabelas"]
+
+        try:
+            with get_database_connection() as db_conn:
+                if db_conn["type"] == "supabase":
+                    tabelas = _inspecionar_supabase(db_conn["client"])
+                else:
+                    tabelas = _inspecionar_sqlite(db_conn["client"])
+        except Exception as e:
+            # Sem registro, nada é cacheado: a próxima chamada tenta de novo
+            logger.warning(f"⚠️ Falha ao inspecionar o esquema do banco: {str(e)}")
+            raise
+
+        _esquema["tabelas"] = tabelas
+        if watermark is not None:
+            _esquema["watermark"] = watermark
+        logger.info(f"🗂️ Esquema inspecionado: {len(tabelas)} tabelas")
+        return tabelas
+
+def invalidar_esquema():
+    """Força nova inspeção na próxima consulta ao registro (após migrações)"""
+    with _trava_esquema:
+        _esquema["tabelas"] = None
+
+def tabela_existe(tabela: str, watermark: Optional[int] = None) -> bool:
+    """
+    Verifica no registro do esquema se a tabela existe (sem consultá-la)
+    """
+    return tabela in esquema_banco(watermark)
+
+def colunas_tabela(tabela: str, watermark: Optional[int] = None) -> List[str]:
+    """
+    Colunas da tabela segundo o registro do esquema ([] se não existir)
+    """
+    return list(esquema_banco(watermark).get(tabela, []))
+
+def primeira_tabela_existente(tabelas: List[str], watermark: Optional[int] = None) -> Optional[str]:
+    """
+    Primeira tabela da lista (em ordem de preferência) presente no banco
+    """
+    esquema = esquema_banco(watermark)
+    return next((t for t in tabelas if t in esquema), None)
+
+_ouvintes_ingestao = []
+
+def registrar_ouvinte_ingestao(callback):
+    """
+    Registra função chamada como callback(tabela) após cada gravação bem-sucedida
+    (ex.: invalidar caches de leitura)
+    """
+    if callback not in _ouvintes_ingestao:
+        _ouvintes_ingestao.append(callback)
+
+def _notificar_ingestao(table: str):
+    for callback in _ouvintes_ingestao:
+        try:
+            callback(table)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao notificar ingestão em {table}: {str(e)}")
+
+SQL_TABELA_WATERMARK = """
+CREATE TABLE IF NOT EXISTS ingestao_watermark (
+    tabela TEXT PRIMARY KEY,
+    ultima_data_iso TEXT,
+    lote_id INTEGER NOT NULL,
+    atualizado_em TEXT
+)
+"""
+
+def _ultima_data_iso(rows: List[dict]) -> Optional[str]:
+    """Maior data (ISO) entre as linhas gravadas"""
+    datas = [data_br_para_iso(linha.get('data')) for linha in rows]
+    datas = [d for d in datas if d]
+    return max(datas) if datas else None
+
+def _avancar_watermark_sqlite(conn, table: str, rows: List[dict]):
+    """Registra um novo lote (dentro da mesma transação da gravação)"""
+    conn.execute(SQL_TABELA_WATERMARK)
+    conn.execute(
+        """
+        INSERT INTO ingestao_watermark (tabela, ultima_data_iso, lote_id, atualizado_em)
+        VALUES (?, ?, (SELECT COALESCE(MAX(lote_id), 0) + 1 FROM ingestao_watermark), ?)
+        ON CONFLICT(tabela) DO UPDATE SET
+            ultima_data_iso = MAX(COALESCE(ultima_data_iso, ''), COALESCE(excluded.ultima_data_iso, '')),
+            lote_id = excluded.lote_id,
+            atualizado_em = excluded.atualizado_em
+        """,
+        (table, _ultima_data_iso(rows), datetime.now().isoformat(timespec='seconds'))
+    )
+
+def _avancar_watermark_supabase(client, table: str, rows: List[dict]):
+    """
+    Registra um novo lote após a gravação no Supabase
+
+    As linhas já foram gravadas: uma falha aqui só gera aviso (os caches de
+    leitura ainda expiram pelo TTL).
+    """
+    try:
+        atual = client.table('ingestao_watermark').select('lote_id,tabela,ultima_data_iso') \
+            .order('lote_id', desc=True).execute().data
+        lote_id = (atual[0]['lote_id'] if atual else 0) + 1
+        anterior = next((w['ultima_data_iso'] for w in atual if w['tabela'] == table), None)
+
+        ultima = max(filter(None, [anterior, _ultima_data_iso(rows)]), default=None)
+        client.table('ingestao_watermark').upsert({
+            'tabela': table,
+            'ultima_data_iso': ultima,
+            'lote_id': lote_id,
+            'atualizado_em': datetime.now().isoformat(timespec='seconds'),
+        }, on_conflict='tabela').execute()
     except Exception as e:
-        st.error(f"❌ Erro ao inserir dados: {str(e)}")
+        logger.warning(f"⚠️ Watermark de {table} não avançado: {str(e)}")
+
+def get_watermark() -> int:
+    """
+    Último lote de ingestão (0 se nunca houve); uma consulta de uma linha
+
+    Serve de chave para os caches de leitura: só muda quando dados novos chegam.
+    """
+    ultimo = consultar(
+        'ingestao_watermark',
+        colunas=['lote_id'],
+        ordenar_por=[('lote_id', True)],
+        limite=1,
+        exibir_erro=False
+    )
+    return int(ultimo.iloc[0]['lote_id']) if not ultimo.empty else 0
+
+# Rollups mensais mantidos na gravação: tabela de origem -> (tabela do rollup, DDL, recálculo)
+# O recálculo recebe o início e o fim (exclusivo) do mês e usa a faixa indexada em data_iso
+ROLLUPS_MENSAIS = {
+    "rds_vendas": (
+        "rds_mensal",
+        """
+        CREATE TABLE IF NOT EXISTS rds_mensal (
+            mes TEXT PRIMARY KEY,
+            faturamento_mes REAL,
+            eventos_mes REAL,
+            pax_mes INTEGER,
+            vendas_mes INTEGER,
+            ocupacao_media REAL,
+            ultima_data_iso TEXT
+        )
+        """,
+        """
+        INSERT INTO rds_mensal
+            (mes, faturamento_mes, eventos_mes, pax_mes, vendas_mes, ocupacao_media, ultima_data_iso)
+        SELECT substr(data_iso, 1, 7), SUM(valor_total), SUM(valor_eventos), SUM(pax_hoje),
+               COUNT(*), AVG(ocupacao_hoje), MAX(data_iso)
+        FROM rds_vendas
+        WHERE data_iso >= ? AND data_iso < ?
+        GROUP BY substr(data_iso, 1, 7)
+        """,
+    ),
+    "chart_compradores_duplo": (
+        "chart_comprador_mensal",
+        """
+        CREATE TABLE IF NOT EXISTS chart_comprador_mensal (
+            mes TEXT NOT NULL,
+            comprador TEXT NOT NULL,
+            total_reservas INTEGER,
+            reservas_dia INTEGER,
+            qtd_reservas INTEGER,
+            comprador_id INTEGER,
+            PRIMARY KEY (mes, comprador)
+        )
+        """,
+        """
+        INSERT INTO chart_comprador_mensal
+            (mes, comprador, total_reservas, reservas_dia, qtd_reservas, comprador_id)
+        SELECT substr(data_iso, 1, 7), comprador, SUM(total_reservas), SUM(reservas_dia), COUNT(*),
+               MAX(comprador_id)
+        FROM chart_compradores_duplo
+        WHERE data_iso >= ? AND data_iso < ?
+        GROUP BY substr(data_iso, 1, 7), comprador
+        """,
+    ),
+}
+
+def _faixa_mes(mes: str) -> Tuple[str, str]:
+    """'aaaa-mm' -> (primeiro dia do mês, primeiro dia do mês seguinte) em ISO"""
+    ano, numero = int(mes[:4]), int(mes[5:7])
+    seguinte = f"{ano + 1}-01" if numero == 12 else f"{ano}-{numero + 1:02d}"
+    return f"{mes}-01", f"{seguinte}-01"
+
+def _meses_afetados(rows: List[dict]) -> List[str]:
+    """Meses ('aaaa-mm') tocados pelas linhas gravadas"""
+    datas = (data_br_para_iso(linha.get('data')) for linha in rows)
+    return sorted({d[:7] for d in datas if d})
+
+def _recalcular_rollup_sqlite(conn, table: str, meses: List[str]) -> bool:
+    """
+    Recalcula apenas os meses informados do rollup da tabela (na transação do chamador)
+
+    Só atua depois de migrar_esquema criar o rollup (e a coluna data_iso).
+    """
+    if table not in ROLLUPS_MENSAIS or not meses:
+        return False
+    rollup, _, sql_recalculo = ROLLUPS_MENSAIS[table]
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (rollup,)
+    ).fetchone()
+    if not existe:
         return False
-    finally:
-        if db_conn["type"] == "sqlite":
-            db_conn["client"].close()
+
+    conn.executemany(f"DELETE FROM {rollup} WHERE mes = ?", [(mes,) for mes in meses])
+    conn.executemany(sql_recalculo, [_faixa_mes(mes) for mes in meses])
+    return True
+
+def _recalcular_rollup_supabase(client, table: str, meses: List[str]):
+    """Recalcula os meses no Postgres (função de SQL_MIGRACAO_ROLLUPS_POSTGRES)"""
+    if table not in ROLLUPS_MENSAIS or not meses:
+        return
+    try:
+        client.rpc('atualizar_rollups_mensais', {'tabela': table, 'meses': meses}).execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Rollup mensal de {table} não atualizado: {str(e)}")
+
+# Dimensão de compradores: classificação feita uma vez, na ingestão (utils/compradores.py)
+SQL_TABELA_COMPRADORES = """
+CREATE TABLE IF NOT EXISTS compradores (
+    id INTEGER PRIMARY KEY,
+    nome_normalizado TEXT NOT NULL UNIQUE,
+    nome TEXT NOT NULL,
+    categoria TEXT NOT NULL,
+    rotulo TEXT NOT NULL
+)
+"""
+
+# Tabelas cujas linhas recebem comprador_id (referência a compradores.id)
+TABELAS_COM_COMPRADOR = ("chart_compradores_duplo",)
+
+def _novos_compradores(rows: List[dict]) -> List[dict]:
+    """Classificação de cada nome distinto presente nas linhas"""
+    classificados = {}
+    for linha in rows:
+        comprador = classificar_comprador(linha.get('comprador'))
+        if comprador['nome_normalizado']:
+            classificados.setdefault(comprador['nome_normalizado'], comprador)
+    return list(classificados.values())
+
+def _ids_compradores_sqlite(conn, rows: List[dict]) -> Dict[str, int]:
+    """Registra os compradores ainda não vistos e retorna nome_normalizado -> id"""
+    novos = _novos_compradores(rows)
+    if not novos:
+        return {}
+    conn.executemany(
+        "INSERT INTO compradores (nome_normalizado, nome, categoria, rotulo) "
+        "VALUES (:nome_normalizado, :nome, :categoria, :rotulo) "
+        "ON CONFLICT(nome_normalizado) DO NOTHING",
+        novos
+    )
+    chaves = [c['nome_normalizado'] for c in novos]
+    cursor = conn.execute(
+        f"SELECT nome_normalizado, id FROM compradores "
+        f"WHERE nome_normalizado IN ({','.join('?' for _ in chaves)})",
+        chaves
+    )
+    return dict(cursor.fetchall())
+
+def _ids_compradores_supabase(client, rows: List[dict]) -> Dict[str, int]:
+    """Mesmo que _ids_compradores_sqlite, via PostgREST"""
+    novos = _novos_compradores(rows)
+    if not novos:
+        return {}
+    client.table('compradores').upsert(
+        novos, on_conflict='nome_normalizado', ignore_duplicates=True
+    ).execute()
+    registros = client.table('compradores').select('nome_normalizado,id') \
+        .in_('nome_normalizado', [c['nome_normalizado'] for c in novos]).execute().data
+    return {r['nome_normalizado']: r['id'] for r in registros}
+
+def _com_comprador_id(rows: List[dict], ids: Dict[str, int]) -> List[dict]:
+    """Cópia das linhas com comprador_id preenchido"""
+    return [
+        {**linha, 'comprador_id': ids.get(normalizar_comprador(linha.get('comprador')))}
+        for linha in rows
+    ]
+
+def insert_data(table: str, data: dict) -> bool:
+    """
+    Insere dados na tabela especificada
+    """
+    return insert_many(table, [data])["sucesso"]
+
+def _possui_indice_unico(conn, table: str, colunas: List[str]) -> bool:
+    """Verifica se existe índice único exatamente sobre as colunas informadas"""
+    for indice in conn.execute(f"PRAGMA index_list({table})"):
+        nome, unico = indice[1], indice[2]
+        if unico:
+            colunas_indice = [c[2] for c in conn.execute(f"PRAGMA index_info({nome})")]
+            if sorted(colunas_indice) == sorted(colunas):
+                return True
+    return False
+
+def _inserir_lote_sqlite(conn, table: str, colunas: List[str], valores: List[tuple], on_conflict: Optional[List[str]]):
+    """Executa um lote com executemany (dentro da transação do chamador)"""
+    placeholders = ','.join('?' for _ in colunas)
+    sql_insert = f"INSERT INTO {table} ({','.join(colunas)}) VALUES ({placeholders})"
+
+    if on_conflict and _possui_indice_unico(conn, table, on_conflict):
+        # Upsert nativo sobre a restrição única (ver migrar_chaves_naturais)
+        atualizar = [c for c in colunas if c not in on_conflict]
+        if atualizar:
+            sql_insert += (
+                f" ON CONFLICT({','.join(on_conflict)}) DO UPDATE SET "
+                + ", ".join(f"{c} = excluded.{c}" for c in atualizar)
+            )
+        else:
+            sql_insert += f" ON CONFLICT({','.join(on_conflict)}) DO NOTHING"
+        conn.executemany(sql_insert, valores)
+        return
+
+    if on_conflict:
+        # Sem restrição única: remove as linhas com as mesmas chaves antes de inserir
+        condicao = " AND ".join(f"{c} = ?" for c in on_conflict)
+        indices = [colunas.index(c) for c in on_conflict]
+        conn.executemany(
+            f"DELETE FROM {table} WHERE {condicao}",
+            [tuple(linha[i] for i in indices) for linha in valores]
+        )
+
+    conn.executemany(sql_insert, valores)
+
+def insert_many(
+    table: str,
+    rows: List[dict],
+    chunk_size: int = 500,
+    on_conflict: Optional[List[str]] = None,
+) -> dict:
+    """
+    Insere várias linhas de uma vez
+
+    - SQLite: executemany em uma única transação (um commit para tudo)
+    - Supabase: inserts em lotes de chunk_size linhas por requisição
+
+    Cada chamada bem-sucedida avança o watermark de ingestão (get_watermark)
+    e recalcula os meses afetados nos rollups mensais (ROLLUPS_MENSAIS).
+    Linhas de TABELAS_COM_COMPRADOR recebem comprador_id (dimensão compradores).
+
+    Args:
+        table (str): Tabela de destino
+        rows (list): Linhas (dicts com as mesmas chaves)
+        chunk_size (int): Linhas por lote
+        on_conflict (list): Colunas-chave; se informado, linhas existentes com
+            as mesmas chaves são substituídas (re-execuções não duplicam)
+
+    Returns:
+        dict: sucesso, linhas, segundos, linhas_por_segundo e erro (mensagem, se falhou)
+    """
+    inicio = time.perf_counter()
+    resultado = {"sucesso": True, "linhas": 0, "segundos": 0.0, "linhas_por_segundo": 0.0, "erro": None}
+    if not rows:
+        return resultado
+
+    _validar_identificador(table)
+    colunas = [_validar_identificador(c) for c in rows[0].keys()]
+    for chave in on_conflict or []:
+        if chave not in colunas:
+            raise ValueError(f"Coluna de conflito ausente nas linhas: {chave}")
+    rows = _preencher_chaves_nulas(table, rows)
+    if on_conflict:
+        # Uma linha por chave (a última vence): o upsert não pode tocar a mesma linha duas vezes
+        rows = list({tuple(linha.get(c) for c in on_conflict): linha for linha in rows}.values())
+
+    try:
+        with get_database_connection() as db_conn:
+            if db_conn["type"] == "supabase":
+                if table in TABELAS_COM_COMPRADOR and 'comprador_id' in colunas_tabela(table):
+                    rows = _com_comprador_id(rows, _ids_compradores_supabase(db_conn["client"], rows))
+                tabela = db_conn["client"].table(table)
+                for i in range(0, len(rows), chunk_size):
+                    lote = rows[i:i + chunk_size]
+                    if on_conflict:
+                        tabela.upsert(lote, on_conflict=",".join(on_conflict)).execute()
+                    else:
+                        tabela.insert(lote).execute()
+                    resultado["linhas"] += len(lote)
+                _avancar_watermark_supabase(db_conn["client"], table, rows)
+                _recalcular_rollup_supabase(db_conn["client"], table, _meses_afetados(rows))
+            else:
+                conn = db_conn["client"]
+                with conn:  # uma transação: commit ao final, rollback em erro
+                    if table in TABELAS_COM_COMPRADOR and 'comprador_id' in _colunas_sqlite(conn, table):
+                        rows = _com_comprador_id(rows, _ids_compradores_sqlite(conn, rows))
+                        colunas = list(rows[0].keys())
+                    valores = [tuple(linha.get(c) for c in colunas) for linha in rows]
+                    for i in range(0, len(valores), chunk_size):
+                        _inserir_lote_sqlite(conn, table, colunas, valores[i:i + chunk_size], on_conflict)
+                    _avancar_watermark_sqlite(conn, table, rows)
+                    _recalcular_rollup_sqlite(conn, table, _meses_afetados(rows))
+                resultado["linhas"] = len(valores)
+
+    except Exception as e:
+        logger.error(f"❌ Erro ao inserir dados em {table}: {str(e)}")
+        st.error(f"❌ Erro ao inserir dados em {table}: {str(e)}")
+        resultado["sucesso"] = False
+        resultado["erro"] = str(e)
+
+    if resultado["linhas"]:
+        _notificar_ingestao(table)
+
+    resultado["segundos"] = time.perf_counter() - inicio
+    if resultado["segundos"] > 0:
+        resultado["linhas_por_segundo"] = resultado["linhas"] / resultado["segundos"]
+
+    logger.info(
+        f"📥 {table}: {resultado['linhas']} linhas em {resultado['segundos']:.2f}s "
+        f"({resultado['linhas_por_segundo']:.0f} linhas/s)"
+    )
+    return resultado
+
+def upsert_data(table: str, rows: List[dict], chunk_size: int = 500) -> dict:
+    """
+    Insere ou sobrescreve linhas pela chave natural da tabela (CHAVES_NATURAIS)
+
+    Reprocessar um dia substitui apenas as linhas daquele dia.
+    """
+    if table not in CHAVES_NATURAIS:
+        raise ValueError(f"Tabela sem chave natural definida: {table}")
+    return insert_many(table, rows, chunk_size=chunk_size, on_conflict=list(CHAVES_NATURAIS[table]))
 
 def test_connection() -> bool:
     """
     Testa a conexão com o banco de dados
     """
     try:
-        db_conn = get_database_connection()
-        
-        if db_conn["type"] == "supabase":
-            # Testar com query simples
-            result = db_conn["client"].table("rds_vendas").select("*").limit(1).execute()
-            return True
-        else:
-            # SQLite
-            conn = db_conn["client"]
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1")
-            conn.close()
-            return True
-    
+        with get_database_connection() as db_conn:
+            if db_conn["type"] == "supabase":
+                # Testar com query simples
+                db_conn["client"].table("rds_vendas").select("data").limit(1).execute()
+                return True
+            else:
+                # SQLite
+                cursor = db_conn["client"].cursor()
+                cursor.execute("SELECT 1")
+                return True
+
     except Exception as e:
         st.error(f"❌ Erro na conexão: {str(e)}")
         return False
+
+# Índices criados pela migração de datas ISO (a coluna data_iso vem primeiro
+# para que filtros por período sejam buscas por faixa no índice)
+INDICES_DATA_ISO = {
+    "rds_vendas": ("data_iso",),
+    "chart_compradores_duplo": ("data_iso", "comprador"),
+    "chart_compradores": ("data_iso", "comprador"),
+}
+
+# dd/mm/aaaa -> aaaa-mm-dd
+EXPRESSAO_DATA_ISO_SQLITE = "substr(data, 7, 4) || '-' || substr(data, 4, 2) || '-' || substr(data, 1, 2)"
+
+# Executar uma vez no SQL Editor do Supabase (DDL não passa pelo PostgREST)
+SQL_MIGRACAO_DATA_ISO_POSTGRES = """
+ALTER TABLE rds_vendas ADD COLUMN IF NOT EXISTS data_iso date GENERATED ALWAYS AS (
+    CASE WHEN data ~ '^\\d{2}/\\d{2}/\\d{4}$'
+         THEN make_date(substr(data, 7, 4)::int, substr(data, 4, 2)::int, substr(data, 1, 2)::int)
+    END
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_rds_vendas_data_iso ON rds_vendas (data_iso);
+
+ALTER TABLE chart_compradores_duplo ADD COLUMN IF NOT EXISTS data_iso date GENERATED ALWAYS AS (
+    CASE WHEN data ~ '^\\d{2}/\\d{2}/\\d{4}$'
+         THEN make_date(substr(data, 7, 4)::int, substr(data, 4, 2)::int, substr(data, 1, 2)::int)
+    END
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_chart_compradores_duplo_data_iso_comprador
+    ON chart_compradores_duplo (data_iso, comprador);
+
+-- Tabela legada (fonte alternativa do Chart em repository._load_chart), se existir
+DO $$
+BEGIN
+    IF to_regclass('chart_compradores') IS NOT NULL THEN
+        ALTER TABLE chart_compradores ADD COLUMN IF NOT EXISTS data_iso date GENERATED ALWAYS AS (
+            CASE WHEN data ~ '^\\d{2}/\\d{2}/\\d{4}$'
+                 THEN make_date(substr(data, 7, 4)::int, substr(data, 4, 2)::int, substr(data, 1, 2)::int)
+            END
+        ) STORED;
+        CREATE INDEX IF NOT EXISTS idx_chart_compradores_data_iso_comprador
+            ON chart_compradores (data_iso, comprador);
+    END IF;
+END
+$$;
+"""
+
+# Chaves naturais (uma linha por chave) usadas nas restrições únicas e no upsert
+CHAVES_NATURAIS = {
+    "rds_vendas": ("data",),
+    "chart_compradores_duplo": ("data", "comprador", "dia_referencia"),
+}
+
+# Colunas da chave natural que não podem ficar nulas (no índice único do SQLite
+# NULLs são distintos, então a mesma linha seria inserida de novo):
+# tabela -> {coluna: coluna cujo valor a substitui quando nula}
+SUBSTITUTOS_CHAVE_NULA = {
+    "chart_compradores_duplo": {"dia_referencia": "data"},
+}
+
+def _preencher_chaves_nulas(table: str, rows: List[dict]) -> List[dict]:
+    """Cópia das linhas com as colunas de SUBSTITUTOS_CHAVE_NULA preenchidas"""
+    substitutos = SUBSTITUTOS_CHAVE_NULA.get(table)
+    if not substitutos:
+        return rows
+    return [
+        {**linha, **{c: linha.get(s) for c, s in substitutos.items() if linha.get(c) is None}}
+        for linha in rows
+    ]
+
+# Executar uma vez no SQL Editor do Supabase: tabela do watermark de ingestão
+SQL_MIGRACAO_WATERMARK_POSTGRES = """
+CREATE TABLE IF NOT EXISTS ingestao_watermark (
+    tabela text PRIMARY KEY,
+    ultima_data_iso date,
+    lote_id bigint NOT NULL,
+    atualizado_em timestamp
+);
+"""
+
+# Executar uma vez no SQL Editor do Supabase: remove duplicatas (mantém a
+# linha mais recente) e cria as restrições usadas pelo upsert on_conflict
+SQL_MIGRACAO_CHAVES_POSTGRES = """
+UPDATE chart_compradores_duplo SET dia_referencia = data WHERE dia_referencia IS NULL;
+
+DELETE FROM rds_vendas a USING rds_vendas b
+WHERE a.data = b.data AND a.ctid < b.ctid;
+ALTER TABLE rds_vendas ADD CONSTRAINT uq_rds_vendas_data UNIQUE (data);
+
+DELETE FROM chart_compradores_duplo a USING chart_compradores_duplo b
+WHERE a.data = b.data AND a.comprador = b.comprador
+  AND a.dia_referencia IS NOT DISTINCT FROM b.dia_referencia AND a.ctid < b.ctid;
+ALTER TABLE chart_compradores_duplo ADD CONSTRAINT uq_chart_compradores_duplo_chave
+    UNIQUE NULLS NOT DISTINCT (data, comprador, dia_referencia);
+"""
+
+# Executar uma vez no SQL Editor do Supabase: rollups mensais, a função chamada
+# após cada gravação (insert_many) e a carga inicial dos meses existentes
+SQL_MIGRACAO_ROLLUPS_POSTGRES = """
+CREATE TABLE IF NOT EXISTS rds_mensal (
+    mes text PRIMARY KEY,
+    faturamento_mes numeric,
+    eventos_mes numeric,
+    pax_mes bigint,
+    vendas_mes bigint,
+    ocupacao_media numeric,
+    ultima_data_iso date
+);
+
+CREATE TABLE IF NOT EXISTS chart_comprador_mensal (
+    mes text NOT NULL,
+    comprador text NOT NULL,
+    total_reservas bigint,
+    reservas_dia bigint,
+    qtd_reservas bigint,
+    comprador_id bigint,
+    PRIMARY KEY (mes, comprador)
+);
+ALTER TABLE chart_comprador_mensal ADD COLUMN IF NOT EXISTS comprador_id bigint;
+
+CREATE OR REPLACE FUNCTION atualizar_rollups_mensais(tabela text, meses text[])
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    m text;
+    inicio date;
+    fim date;
+BEGIN
+    FOREACH m IN ARRAY meses LOOP
+        inicio := to_date(m || '-01', 'YYYY-MM-DD');
+        fim := (inicio + interval '1 month')::date;
+        IF tabela = 'rds_vendas' THEN
+            DELETE FROM rds_mensal WHERE mes = m;
+            INSERT INTO rds_mensal
+                (mes, faturamento_mes, eventos_mes, pax_mes, vendas_mes, ocupacao_media, ultima_data_iso)
+            SELECT m, SUM(valor_total), SUM(valor_eventos), SUM(pax_hoje),
+                   COUNT(*), AVG(ocupacao_hoje), MAX(data_iso)
+            FROM rds_vendas
+            WHERE data_iso >= inicio AND data_iso < fim
+            HAVING COUNT(*) > 0;
+        ELSIF tabela = 'chart_compradores_duplo' THEN
+            DELETE FROM chart_comprador_mensal WHERE mes = m;
+            INSERT INTO chart_comprador_mensal
+                (mes, comprador, total_reservas, reservas_dia, qtd_reservas, comprador_id)
+            SELECT m, comprador, SUM(total_reservas), SUM(reservas_dia), COUNT(*), MAX(comprador_id)
+            FROM chart_compradores_duplo
+            WHERE data_iso >= inicio AND data_iso < fim
+            GROUP BY comprador;
+        END IF;
+    END LOOP;
+END;
+$$;
+
+SELECT atualizar_rollups_mensais('rds_vendas',
+    ARRAY(SELECT DISTINCT to_char(data_iso, 'YYYY-MM') FROM rds_vendas WHERE data_iso IS NOT NULL));
+SELECT atualizar_rollups_mensais('chart_compradores_duplo',
+    ARRAY(SELECT DISTINCT to_char(data_iso, 'YYYY-MM') FROM chart_compradores_duplo WHERE data_iso IS NOT NULL));
+"""
+
+# Executar uma vez no SQL Editor do Supabase: números da página Resumo Geral
+# em uma única chamada RPC (mesmo conteúdo de SECOES_KPIS em utils/repository.py)
+SQL_MIGRACAO_KPIS_RESUMO_POSTGRES = """
+DROP FUNCTION IF EXISTS kpis_resumo(text, date, date, text[]);
+CREATE OR REPLACE FUNCTION kpis_resumo(mes_ref text, categorias text[])
+RETURNS json LANGUAGE sql STABLE AS $$
+SELECT json_build_object(
+    'ultimo_dia', (
+        SELECT row_to_json(u) FROM (
+            SELECT data, valor_total, pax_hoje, ocupacao_hoje, valor_eventos, diaria_media_uh
+            FROM rds_vendas
+            ORDER BY data_iso DESC NULLS LAST
+            LIMIT 1
+        ) u
+    ),
+    'acumulado_mes', (
+        SELECT row_to_json(m) FROM (
+            SELECT faturamento_mes, vendas_mes, ocupacao_media
+            FROM rds_mensal WHERE mes = mes_ref
+        ) m
+    ),
+    'top_ota', COALESCE((
+        SELECT json_agg(t) FROM (
+            SELECT COALESCE(d.rotulo, r.comprador) AS ota_agencia, r.total_reservas, r.qtd_reservas
+            FROM chart_comprador_mensal r
+            LEFT JOIN compradores d ON d.id = r.comprador_id
+            WHERE r.mes = mes_ref
+            ORDER BY r.total_reservas DESC
+            LIMIT 5
+        ) t
+    ), '[]'::json),
+    'vendas_internas', COALESCE((
+        SELECT json_agg(v) FROM (
+            SELECT d.rotulo AS categoria_venda, SUM(r.total_reservas) AS total_reservas,
+                   SUM(r.reservas_dia) AS reservas_dia_especifico
+            FROM chart_comprador_mensal r
+            JOIN compradores d ON d.id = r.comprador_id
+            WHERE r.mes = mes_ref AND d.categoria = ANY (categorias)
+            GROUP BY d.id, d.rotulo
+            ORDER BY 2 DESC
+        ) v
+    ), '[]'::json)
+);
+$$;
+"""
+
+# Executar uma vez no SQL Editor do Supabase, antes de migrar_compradores
+# (que preenche a dimensão e os comprador_id das linhas já gravadas)
+SQL_MIGRACAO_COMPRADORES_POSTGRES = """
+CREATE TABLE IF NOT EXISTS compradores (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    nome_normalizado text NOT NULL UNIQUE,
+    nome text NOT NULL,
+    categoria text NOT NULL,
+    rotulo text NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_compradores_categoria ON compradores (categoria);
+
+ALTER TABLE chart_compradores_duplo ADD COLUMN IF NOT EXISTS comprador_id bigint REFERENCES compradores (id);
+CREATE INDEX IF NOT EXISTS idx_chart_compradores_duplo_comprador_id_data_iso
+    ON chart_compradores_duplo (comprador_id, data_iso);
+"""
+
+def data_br_para_iso(data_br) -> Optional[str]:
+    """
+    Converte 'dd/mm/aaaa' (ou date/datetime) para 'aaaa-mm-dd'
+    """
+    if data_br is None or data_br == '':
+        return None
+    if hasattr(data_br, 'strftime'):
+        return data_br.strftime('%Y-%m-%d')
+    try:
+        return datetime.strptime(str(data_br), '%d/%m/%Y').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+def periodo_mes(ano: int, mes: int, coluna: str = 'data_iso') -> List[tuple]:
+    """
+    Filtros (para consultar) do mês como faixa semiaberta em ISO:
+    coluna >= primeiro dia do mês AND coluna < primeiro dia do mês seguinte
+
+    Comparações diretas na coluna usam o índice de data_iso em qualquer mês.
+    """
+    if not 1 <= int(mes) <= 12:
+        raise ValueError(f"Mês inválido: {mes}")
+    inicio, fim = _faixa_mes(f"{int(ano):04d}-{int(mes):02d}")
+    return [(coluna, 'gte', inicio), (coluna, 'lt', fim)]
+
+def _colunas_sqlite(conn, tabela: str) -> List[str]:
+    """Colunas da tabela, incluindo colunas geradas"""
+    return [linha[1] for linha in conn.execute(f"PRAGMA table_xinfo({_validar_identificador(tabela)})")]
+
+def migrar_datas_iso(gerenciador: Optional[GerenciadorConexoes] = None) -> Dict[str, str]:
+    """
+    Adiciona a coluna data_iso (aaaa-mm-dd) e os índices de período
+
+    No SQLite a coluna é gerada a partir de `data`, então linhas antigas ficam
+    preenchidas na hora e novos inserts não precisam informá-la. Idempotente.
+
+    Returns:
+        dict: tabela -> "migrada", "ja_migrada" ou "ausente"
+    """
+    gerenciador = gerenciador or get_gerenciador_conexoes()
+
+    if gerenciador.tipo() == "supabase":
+        logger.info("ℹ️ Supabase: execute SQL_MIGRACAO_DATA_ISO_POSTGRES no SQL Editor")
+        return {}
+
+    resultado = {}
+    with gerenciador.sqlite() as conn:
+        for tabela, colunas_indice in INDICES_DATA_ISO.items():
+            colunas = _colunas_sqlite(conn, tabela)
+            if not colunas:
+                resultado[tabela] = "ausente"
+                continue
+
+            if "data_iso" in colunas:
+                resultado[tabela] = "ja_migrada"
+            else:
+                conn.execute(
+                    f"ALTER TABLE {tabela} ADD COLUMN data_iso TEXT "
+                    f"GENERATED ALWAYS AS ({EXPRESSAO_DATA_ISO_SQLITE}) VIRTUAL"
+                )
+                resultado[tabela] = "migrada"
+
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{tabela}_{'_'.join(colunas_indice)} "
+                f"ON {tabela} ({', '.join(colunas_indice)})"
+            )
+        conn.commit()
+
+    for tabela, estado in resultado.items():
+        logger.info(f"🗂️ {tabela}: {estado}")
+    return resultado
+
+def migrar_chaves_naturais(gerenciador: Optional[GerenciadorConexoes] = None) -> Dict[str, int]:
+    """
+    Remove duplicatas e cria índices únicos sobre CHAVES_NATURAIS (idempotente)
+
+    Mantém a linha inserida por último de cada chave. Colunas da chave nulas
+    recebem antes o valor de SUBSTITUTOS_CHAVE_NULA (também com índice já criado).
+
+    Returns:
+        dict: tabela -> número de duplicatas removidas
+    """
+    gerenciador = gerenciador or get_gerenciador_conexoes()
+
+    if gerenciador.tipo() == "supabase":
+        logger.info("ℹ️ Supabase: execute SQL_MIGRACAO_CHAVES_POSTGRES no SQL Editor")
+        return {}
+
+    resultado = {}
+    with gerenciador.sqlite() as conn:
+        for tabela, chaves in CHAVES_NATURAIS.items():
+            colunas = _colunas_sqlite(conn, tabela)
+            if not colunas:
+                continue
+
+            for coluna, substituta in SUBSTITUTOS_CHAVE_NULA.get(tabela, {}).items():
+                meses = []
+                if 'data_iso' in colunas:
+                    meses = [
+                        linha[0] for linha in conn.execute(
+                            f"SELECT DISTINCT substr(data_iso, 1, 7) FROM {tabela} "
+                            f"WHERE {coluna} IS NULL AND data_iso IS NOT NULL"
+                        )
+                    ]
+                with conn:
+                    # OR REPLACE: se a chave preenchida já existir, a linha atualizada
+                    # substitui a anterior (entre nulas repetidas, vence a de maior rowid)
+                    cursor = conn.execute(
+                        f"UPDATE OR REPLACE {tabela} SET {coluna} = {substituta} WHERE {coluna} IS NULL"
+                    )
+                    _recalcular_rollup_sqlite(conn, tabela, meses)
+                if cursor.rowcount:
+                    logger.info(f"🔑 {tabela}: {cursor.rowcount} linhas com {coluna} nulo preenchidas")
+
+            if _possui_indice_unico(conn, tabela, list(chaves)):
+                continue
+
+            with conn:
+                cursor = conn.execute(
+                    f"DELETE FROM {tabela} WHERE rowid NOT IN "
+                    f"(SELECT MAX(rowid) FROM {tabela} GROUP BY {', '.join(chaves)})"
+                )
+                conn.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{tabela}_chave ON {tabela} ({', '.join(chaves)})"
+                )
+            resultado[tabela] = cursor.rowcount
+            logger.info(f"🔑 {tabela}: índice único criado, {cursor.rowcount} duplicatas removidas")
+
+    return resultado
+
+def migrar_compradores(gerenciador: Optional[GerenciadorConexoes] = None) -> Dict[str, int]:
+    """
+    Cria a dimensão compradores, reclassifica os nomes já vistos pelas regras
+    atuais e preenche comprador_id nas linhas existentes (idempotente)
+
+    No Supabase depende de SQL_MIGRACAO_COMPRADORES_POSTGRES já aplicado.
+
+    Returns:
+        dict: tabela -> número de compradores distintos associados
+    """
+    gerenciador = gerenciador or get_gerenciador_conexoes()
+    resultado = {}
+
+    if gerenciador.tipo() == "supabase":
+        invalidar_esquema()
+        if not tabela_existe('compradores'):
+            logger.info("ℹ️ Supabase: execute SQL_MIGRACAO_COMPRADORES_POSTGRES no SQL Editor")
+            return resultado
+        client = gerenciador.supabase()
+        for tabela in TABELAS_COM_COMPRADOR:
+            if 'comprador_id' not in colunas_tabela(tabela):
+                continue
+            nomes = {
+                linha['comprador']
+                for pagina in iterar_paginas_supabase(
+                    client, tabela, colunas='comprador', ordenar_por=[('comprador', False)]
+                )
+                for linha in pagina.to_dict('records')
+            }
+            novos = _novos_compradores([{'comprador': n} for n in nomes])
+            if novos:
+                client.table('compradores').upsert(novos, on_conflict='nome_normalizado').execute()
+            ids = _ids_compradores_supabase(client, [{'comprador': n} for n in nomes])
+            for nome in nomes:
+                client.table(tabela).update(
+                    {'comprador_id': ids.get(normalizar_comprador(nome))}
+                ).eq('comprador', nome).execute()
+            resultado[tabela] = len(nomes)
+        return resultado
+
+    with gerenciador.sqlite() as conn:
+        for tabela in TABELAS_COM_COMPRADOR:
+            colunas = _colunas_sqlite(conn, tabela)
+            if not colunas:
+                continue
+
+            with conn:
+                conn.execute(SQL_TABELA_COMPRADORES)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_compradores_categoria ON compradores (categoria)")
+                if 'comprador_id' not in colunas:
+                    conn.execute(f"ALTER TABLE {tabela} ADD COLUMN comprador_id INTEGER REFERENCES compradores(id)")
+                if 'data_iso' in colunas:
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{tabela}_comprador_id_data_iso "
+                        f"ON {tabela} (comprador_id, data_iso)"
+                    )
+                if _colunas_sqlite(conn, 'chart_comprador_mensal') and \
+                        'comprador_id' not in _colunas_sqlite(conn, 'chart_comprador_mensal'):
+                    conn.execute("ALTER TABLE chart_comprador_mensal ADD COLUMN comprador_id INTEGER")
+                    # Rollup sem ids: esvaziado para migrar_rollups preenchê-lo de novo
+                    conn.execute("DELETE FROM chart_comprador_mensal")
+
+                # Só linhas ainda sem id (a ingestão já preenche as novas)
+                nomes = [
+                    linha[0] for linha in conn.execute(
+                        f"SELECT DISTINCT comprador FROM {tabela} WHERE comprador_id IS NULL"
+                    )
+                ]
+                meses = [
+                    linha[0] for linha in conn.execute(
+                        f"SELECT DISTINCT substr(data_iso, 1, 7) FROM {tabela} "
+                        f"WHERE comprador_id IS NULL AND data_iso IS NOT NULL"
+                    )
+                ] if 'data_iso' in colunas else []
+                conhecidos = [linha[0] for linha in conn.execute("SELECT nome FROM compradores")]
+                # Regras podem ter mudado: categoria e rótulo seguem a classificação atual
+                conn.executemany(
+                    "INSERT INTO compradores (nome_normalizado, nome, categoria, rotulo) "
+                    "VALUES (:nome_normalizado, :nome, :categoria, :rotulo) "
+                    "ON CONFLICT(nome_normalizado) DO UPDATE SET "
+                    "categoria = excluded.categoria, rotulo = excluded.rotulo",
+                    _novos_compradores([{'comprador': n} for n in conhecidos + nomes])
+                )
+                ids = dict(conn.execute("SELECT nome_normalizado, id FROM compradores").fetchall())
+                conn.executemany(
+                    f"UPDATE {tabela} SET comprador_id = ? WHERE comprador = ?",
+                    [(ids.get(normalizar_comprador(n)), n) for n in nomes]
+                )
+                _recalcular_rollup_sqlite(conn, tabela, meses)
+            resultado[tabela] = len(nomes)
+            logger.info(f"🏷️ {tabela}: {len(nomes)} compradores classificados")
+
+    return resultado
+
+def migrar_rollups(gerenciador: Optional[GerenciadorConexoes] = None) -> Dict[str, int]:
+    """
+    Cria os rollups mensais e preenche os que estiverem vazios (idempotente)
+
+    Rollups já preenchidos são mantidos em dia pelas gravações e pelas demais
+    migrações, que recalculam só os meses afetados. Depende da coluna data_iso
+    (migrar_datas_iso).
+
+    Returns:
+        dict: tabela do rollup -> número de meses calculados
+    """
+    gerenciador = gerenciador or get_gerenciador_conexoes()
+
+    if gerenciador.tipo() == "supabase":
+        logger.info("ℹ️ Supabase: execute SQL_MIGRACAO_ROLLUPS_POSTGRES no SQL Editor")
+        return {}
+
+    resultado = {}
+    with gerenciador.sqlite() as conn:
+        for tabela, (rollup, sql_tabela, _) in ROLLUPS_MENSAIS.items():
+            if "data_iso" not in _colunas_sqlite(conn, tabela):
+                continue
+
+            with conn:
+                conn.execute(sql_tabela)
+                if conn.execute(f"SELECT 1 FROM {rollup} LIMIT 1").fetchone():
+                    continue
+                meses = [
+                    linha[0] for linha in conn.execute(
+                        f"SELECT DISTINCT substr(data_iso, 1, 7) FROM {tabela} WHERE data_iso IS NOT NULL"
+                    )
+                ]
+                _recalcular_rollup_sqlite(conn, tabela, meses)
+            resultado[rollup] = len(meses)
+            logger.info(f"📆 {rollup}: {len(meses)} meses calculados")
+
+    return resultado
+
+def verificar_esquema(gerenciador: GerenciadorConexoes) -> List[str]:
+    """
+    Preparo do banco na abertura do app (SQLite), sem alterar dados
+
+    Adiciona data_iso e os índices de período e cria a tabela do watermark.
+    Remoção de duplicatas, índices únicos, compradores e rollups ficam para
+    migrar_esquema (python -m utils.database ou a ingestão); aqui só avisa.
+
+    Returns:
+        list: migrações pendentes
+    """
+    migrar_datas_iso(gerenciador)
+
+    pendentes = []
+    with gerenciador.sqlite() as conn:
+        with conn:
+            conn.execute(SQL_TABELA_WATERMARK)
+        for tabela, chaves in CHAVES_NATURAIS.items():
+            if _colunas_sqlite(conn, tabela) and not _possui_indice_unico(conn, tabela, list(chaves)):
+                pendentes.append(f"índice único de {tabela}")
+        for tabela in TABELAS_COM_COMPRADOR:
+            colunas = _colunas_sqlite(conn, tabela)
+            if colunas and 'comprador_id' not in colunas:
+                pendentes.append(f"compradores de {tabela}")
+        for tabela, (rollup, _, _) in ROLLUPS_MENSAIS.items():
+            if _colunas_sqlite(conn, tabela) and not _colunas_sqlite(conn, rollup):
+                pendentes.append(rollup)
+
+    if pendentes:
+        logger.warning(f"⚠️ Migrações pendentes ({', '.join(pendentes)}): execute python -m utils.database")
+    invalidar_esquema()
+    return pendentes
+
+def migrar_esquema(gerenciador: Optional[GerenciadorConexoes] = None):
+    """
+    Aplica todas as migrações idempotentes do banco
+
+    Pode remover linhas duplicadas (migrar_chaves_naturais): rodar como passo
+    do operador (python -m utils.database) ou da ingestão, nunca na leitura.
+    """
+    gerenciador = gerenciador or get_gerenciador_conexoes()
+    migrar_datas_iso(gerenciador)
+    migrar_chaves_naturais(gerenciador)
+    migrar_compradores(gerenciador)
+    migrar_rollups(gerenciador)
+
+    if gerenciador.tipo() == "supabase":
+        logger.info("ℹ️ Supabase: execute SQL_MIGRACAO_WATERMARK_POSTGRES no SQL Editor")
+        logger.info("ℹ️ Supabase: execute SQL_MIGRACAO_KPIS_RESUMO_POSTGRES no SQL Editor")
+    else:
+        with gerenciador.sqlite() as conn:
+            with conn:
+                conn.execute(SQL_TABELA_WATERMARK)
+
+    invalidar_esquema()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    migrar_esquema()
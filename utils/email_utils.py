@@ -1,7 +1,23 @@
-from imap_tools import MailBox, AND
+from imap_tools import MailBox, AND, U
+from imap_tools.errors import MailboxFetchError
+from imap_tools.utils import check_command_status
 from dotenv import load_dotenv
+from email.header import decode_header, make_header
+from email.message import Message
+from email.parser import BytesHeaderParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from itertools import takewhile
 import os
+import re
+import json
+import sqlite3
+import hashlib
+import base64
+import quopri
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 
 # Configurar logging
@@ -11,6 +27,9 @@ logger = logging.getLogger(__name__)
 # Carregar variáveis do .env
 load_dotenv()
 
+# Pasta onde os PDFs são gravados (relativa ao diretório de execução)
+PASTA_DESTINO = os.getenv("PASTA_PDFS", "pdfs_baixados")
+
 def testar_conexao_gmail():
     """Testa a conexão com o Gmail"""
     try:
@@ -36,76 +55,483 @@ def testar_conexao_gmail():
         logger.error(f"❌ Erro na conexão: {str(e)}")
         return False
 
-def baixar_pdfs_gmail(dias_anteriores=7, pasta_especifica=None):
+# Estado da sincronização incremental (UIDVALIDITY + último UID por pasta)
+ARQUIVO_ESTADO_SYNC = os.getenv("EMAIL_SYNC_STATE", "email_sync_state.json")
+_trava_estado = threading.Lock()
+
+def carregar_estado_sync(caminho=ARQUIVO_ESTADO_SYNC):
+    """Lê o estado da sincronização; vazio se ainda não existir"""
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"⚠️ Estado de sincronização ilegível ({str(e)}), fazendo sincronização completa")
+        return {}
+
+def salvar_estado_sync(estado, caminho=ARQUIVO_ESTADO_SYNC):
+    """Grava o estado da sincronização de forma atômica"""
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=2, sort_keys=True)
+    os.replace(temporario, caminho)
+
+def _criterio_busca(mailbox, pasta, estado_pasta, data_limite):
+    """
+    Define o critério de busca da pasta já selecionada
+
+    Returns:
+        tuple: (critério, último UID já processado, status da pasta)
+    """
+    status = mailbox.folder.status(pasta, ['UIDVALIDITY', 'UIDNEXT'])
+
+    if estado_pasta and estado_pasta.get('uidvalidity') == status['UIDVALIDITY']:
+        ultimo_uid = estado_pasta['ultimo_uid']
+        logger.info(f"🔁 Sincronização incremental: UIDs após {ultimo_uid}")
+        return AND(uid=U(ultimo_uid + 1, '*')), ultimo_uid, status
+
+    if estado_pasta:
+        logger.warning("⚠️ UIDVALIDITY mudou, refazendo sincronização completa")
+    logger.info(f"📅 Buscando emails desde: {data_limite.strftime('%d/%m/%Y')}")
+    return AND(date_gte=data_limite.date()), 0, status
+
+# Manifesto de PDFs por conteúdo (SHA-256 -> arquivo, Message-ID, status)
+ARQUIVO_MANIFESTO = os.getenv("EMAIL_MANIFEST_DB", "pdfs_manifest.db")
+STATUS_BAIXADO, STATUS_EXTRAIDO, STATUS_ERRO = "baixado", "extraido", "erro"
+# Várias sessões IMAP em paralelo gravam na mesma pasta e no mesmo manifesto
+_trava_manifesto = threading.Lock()
+
+SQL_TABELA_MANIFESTO = """
+CREATE TABLE IF NOT EXISTS manifesto_pdfs (
+    sha256 TEXT PRIMARY KEY,
+    nome_arquivo TEXT NOT NULL,
+    message_id TEXT,
+    pasta TEXT,
+    caminho TEXT,
+    status TEXT NOT NULL,
+    criado_em TEXT NOT NULL,
+    atualizado_em TEXT NOT NULL
+)
+"""
+
+@contextmanager
+def manifesto(caminho=None):
+    """Abre o manifesto (cria a tabela se preciso) e faz commit ao sair"""
+    conn = sqlite3.connect(caminho or ARQUIVO_MANIFESTO, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute(SQL_TABELA_MANIFESTO)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+def sha256_bytes(conteudo):
+    """SHA-256 (hex) de um conteúdo em memória"""
+    return hashlib.sha256(conteudo).hexdigest()
+
+def sha256_arquivo(caminho, tamanho_bloco=1 << 20):
+    """SHA-256 de um arquivo lido em blocos"""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def buscar_no_manifesto(sha256, conn=None):
+    """Registro do manifesto para o hash (dict) ou None"""
+    if conn is None:
+        with manifesto() as conn:
+            return buscar_no_manifesto(sha256, conn)
+    linha = conn.execute("SELECT * FROM manifesto_pdfs WHERE sha256 = ?", (sha256,)).fetchone()
+    return dict(linha) if linha else None
+
+def registrar_pdf(sha256, nome_arquivo, caminho, message_id=None, pasta=None, conn=None):
+    """Registra um PDF recém-baixado (ou atualiza o caminho de um já conhecido)"""
+    if conn is None:
+        with manifesto() as conn:
+            return registrar_pdf(sha256, nome_arquivo, caminho, message_id, pasta, conn)
+    agora = datetime.now().isoformat(timespec='seconds')
+    cursor = conn.execute(
+        "INSERT INTO manifesto_pdfs "
+        "(sha256, nome_arquivo, message_id, pasta, caminho, status, criado_em, atualizado_em) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(sha256) DO UPDATE SET caminho = COALESCE(excluded.caminho, caminho), "
+        "atualizado_em = excluded.atualizado_em",
+        (sha256, nome_arquivo, message_id, pasta, caminho, STATUS_BAIXADO, agora, agora),
+    )
+    return cursor.rowcount == 1
+
+def marcar_status(sha256, status, conn=None):
+    """Atualiza o status de ingestão (baixado, extraido, erro) de um PDF"""
+    if conn is None:
+        with manifesto() as conn:
+            return marcar_status(sha256, status, conn)
+    conn.execute(
+        "UPDATE manifesto_pdfs SET status = ?, atualizado_em = ? WHERE sha256 = ?",
+        (status, datetime.now().isoformat(timespec='seconds'), sha256),
+    )
+
+def pdf_ja_extraido(sha256):
+    """True se este conteúdo já foi extraído com sucesso (pular reprocessamento)"""
+    registro = buscar_no_manifesto(sha256)
+    return bool(registro) and registro['status'] == STATUS_EXTRAIDO
+
+def _ja_processado(registro, reprocessar=False, em_disco=True):
+    """
+    Decide se um conteúdo do manifesto pode ser pulado: já extraído, ou
+    (ao gravar em disco) baixado e ainda presente lá - a pasta pode ter
+    sido limpa. Com reprocessar, só a presença em disco conta.
+    """
+    if not registro:
+        return False
+    if registro['status'] == STATUS_EXTRAIDO and not reprocessar:
+        return True
+    return em_disco and bool(registro['caminho']) and os.path.exists(registro['caminho'])
+
+def pdfs_no_manifesto(status=None):
+    """
+    PDFs do manifesto que ainda estão em disco
+
+    Args:
+        status (tuple): Filtrar por status (ex.: (STATUS_BAIXADO, STATUS_ERRO));
+            None devolve todos
+
+    Returns:
+        list: dicts do manifesto (sha256, nome_arquivo, caminho, status, ...)
+    """
+    with manifesto() as conn:
+        linhas = [dict(l) for l in conn.execute("SELECT * FROM manifesto_pdfs WHERE caminho IS NOT NULL ORDER BY criado_em")]
+    return [
+        l for l in linhas
+        if (status is None or l['status'] in status) and os.path.exists(l['caminho'])
+    ]
+
+def remover_pdfs_extraidos():
+    """
+    Apaga do disco os PDFs já extraídos (o manifesto mantém o hash; um
+    --backfill baixa de novo o que não estiver mais em disco)
+
+    Returns:
+        int: PDFs removidos
+    """
+    removidos = 0
+    for registro in pdfs_no_manifesto((STATUS_EXTRAIDO,)):
+        os.remove(registro['caminho'])
+        removidos += 1
+    logger.info(f"🧹 {removidos} PDFs já extraídos removidos do disco")
+    return removidos
+
+def _caminho_livre(pasta_destino, nome, sha256):
+    """Caminho para o PDF; se o nome já existe com outro conteúdo, acrescenta o hash"""
+    caminho = os.path.join(pasta_destino, nome)
+    if os.path.exists(caminho):
+        base, extensao = os.path.splitext(nome)
+        caminho = os.path.join(pasta_destino, f"{base}__{sha256[:8]}{extensao}")
+    return caminho
+
+# Busca em duas fases: primeiro só BODYSTRUCTURE e cabeçalhos, depois apenas
+# as partes PDF relevantes (nada de baixar imagens, assinaturas e outros anexos)
+ITENS_ESTRUTURA = "(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT DATE MESSAGE-ID)])"
+TAMANHO_LOTE_IMAP = int(os.getenv("EMAIL_TAMANHO_LOTE", "50"))
+
+_ABRE, _FECHA = object(), object()
+_TOKEN_IMAP = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}|[^\s()"\[\]]+(?:\[[^\]]*\](?:<\d+>)?)?')
+
+def _tokens_imap(dados):
+    """Quebra a resposta crua do imaplib em tokens (literais {N} chegam como bytes)"""
+    for item in dados:
+        if item is None:
+            continue
+        texto, literal = item if isinstance(item, tuple) else (item, None)
+        for token in _TOKEN_IMAP.findall(texto):
+            if token == b'(':
+                yield _ABRE
+            elif token == b')':
+                yield _FECHA
+            elif token.startswith(b'{'):
+                continue
+            elif token.startswith(b'"'):
+                yield re.sub(rb'\\(.)', rb'\1', token[1:-1]).decode('utf-8', 'replace')
+            elif token.upper() == b'NIL':
+                yield None
+            else:
+                yield token.decode('utf-8', 'replace')
+        if literal is not None:
+            yield literal
+
+def _respostas_fetch(dados):
+    """Converte a resposta de um UID FETCH em um dicionário por mensagem"""
+    pilha = [[]]
+    for token in _tokens_imap(dados):
+        if token is _ABRE:
+            pilha.append([])
+        elif token is _FECHA and len(pilha) > 1:
+            lista = pilha.pop()
+            pilha[-1].append(lista)
+        elif token is not _FECHA:
+            pilha[-1].append(token)
+
+    for item in pilha[0]:
+        if isinstance(item, list):
+            yield {str(chave).upper(): valor for chave, valor in zip(item[::2], item[1::2])}
+
+def _buscar_itens(mailbox, uids, itens, tamanho_lote=TAMANHO_LOTE_IMAP):
+    """
+    Executa UID FETCH dos itens pedidos, em lotes de UIDs
+    
+    Gerador: cada lote só é pedido ao servidor quando o anterior foi consumido.
+    """
+    for inicio in range(0, len(uids), tamanho_lote):
+        resultado = mailbox.client.uid('fetch', ','.join(uids[inicio:inicio + tamanho_lote]), itens)
+        check_command_status(resultado, MailboxFetchError)
+        yield from _respostas_fetch(resultado[1])
+        del resultado
+
+def _texto(valor):
+    """Normaliza um valor do BODYSTRUCTURE (str, literal em bytes ou NIL)"""
+    if isinstance(valor, bytes):
+        return valor.decode('utf-8', 'replace')
+    return valor or ''
+
+def _montar_cabecalho(valor, parametros):
+    """Remonta 'valor; chave="..."' a partir da lista de parâmetros do BODYSTRUCTURE"""
+    partes = [valor]
+    if isinstance(parametros, list):
+        for chave, conteudo in zip(parametros[::2], parametros[1::2]):
+            conteudo = _texto(conteudo).replace('\\', '\\\\').replace('"', '\\"')
+            partes.append(f'{_texto(chave).lower()}="{conteudo}"')
+    return "; ".join(partes)
+
+def _nome_parte(parametros, disposicao):
+    """Nome do anexo com decodificação RFC 2047/2231 (filename ou name)"""
+    cabecalhos = Message()
+    if isinstance(disposicao, list) and disposicao:
+        cabecalhos['Content-Disposition'] = _montar_cabecalho(_texto(disposicao[0]), disposicao[1] if len(disposicao) > 1 else None)
+    cabecalhos['Content-Type'] = _montar_cabecalho('application/octet-stream', parametros)
+
+    nome = cabecalhos.get_filename()
+    if not nome:
+        return None
+    try:
+        return str(make_header(decode_header(nome)))
+    except Exception:
+        return nome
+
+def _partes_pdf(estrutura, prefixo=''):
+    """
+    Percorre o BODYSTRUCTURE e devolve as partes que são PDF
+    
+    Returns:
+        generator: dicts com 'secao', 'nome' e 'encoding' de cada parte
+    """
+    if not isinstance(estrutura, list) or not estrutura:
+        return
+
+    # Multipart: as subpartes vêm primeiro, numeradas a partir de 1
+    if isinstance(estrutura[0], list):
+        for i, filho in enumerate(takewhile(lambda p: isinstance(p, list), estrutura), 1):
+            yield from _partes_pdf(filho, f"{prefixo}.{i}" if prefixo else str(i))
+        return
+
+    secao = prefixo or '1'
+    tipo, subtipo = _texto(estrutura[0]).lower(), _texto(estrutura[1]).lower()
+
+    # Email encaminhado como anexo: descer na mensagem encapsulada
+    if (tipo, subtipo) == ('message', 'rfc822') and len(estrutura) > 8:
+        interna = estrutura[8]
+        multipart = isinstance(interna, list) and interna and isinstance(interna[0], list)
+        yield from _partes_pdf(interna, secao if multipart else f"{secao}.1")
+        return
+
+    # Posição da disposição depende do tipo (text tem linhas, rfc822 tem envelope)
+    indice_disposicao = {'text': 9, 'message': 10}.get(tipo, 8)
+    disposicao = estrutura[indice_disposicao] if len(estrutura) > indice_disposicao else None
+
+    nome = _nome_parte(estrutura[2], disposicao)
+    if not nome:
+        return
+    if subtipo == 'pdf' or nome.lower().endswith('.pdf'):
+        yield {'secao': secao, 'nome': nome, 'encoding': _texto(estrutura[5]).lower()}
+
+def _decodificar_parte(conteudo, encoding):
+    """Decodifica o conteúdo de uma parte conforme o Content-Transfer-Encoding"""
+    if encoding == 'base64':
+        return base64.b64decode(conteudo)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(conteudo)
+    return conteudo
+
+def _gravar_atomico(caminho, conteudo):
+    """Grava em arquivo temporário na mesma pasta e renomeia (sem PDF pela metade)"""
+    temporario = f"{caminho}.part"
+    try:
+        with open(temporario, 'wb') as f:
+            f.write(conteudo)
+        os.replace(temporario, caminho)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+def _cabecalhos(resposta):
+    """Extrai assunto, data e Message-ID da resposta da primeira fase"""
+    bruto = next((v for k, v in resposta.items() if k.startswith('BODY[HEADER')), b'')
+    cabecalhos = BytesHeaderParser().parsebytes(bruto if isinstance(bruto, bytes) else bruto.encode())
+    try:
+        assunto = str(make_header(decode_header(cabecalhos.get('Subject', ''))))
+    except Exception:
+        assunto = cabecalhos.get('Subject', '')
+    return {'assunto': assunto, 'data': cabecalhos.get('Date', ''), 'message_id': cabecalhos.get('Message-ID', '')}
+
+def _iterar_pdfs_pasta(mailbox, email, pasta, data_limite, palavra_chave=None, incremental=True, pasta_destino=None,
+                       vistos=None, reprocessar=False):
+    """
+    Gera os PDFs novos de uma pasta, opcionalmente só UIDs ainda não vistos
+    
+    Primeiro busca só o BODYSTRUCTURE das mensagens; o conteúdo é baixado
+    apenas para as partes PDF que passam no filtro. A deduplicação é pelo
+    SHA-256 do conteúdo no manifesto, não pelo nome do arquivo.
+    As mensagens são processadas uma a uma, em lotes de TAMANHO_LOTE_IMAP,
+    então a memória não cresce com o tamanho da janela de busca.
+    
+    Com pasta_destino, cada PDF também é gravado em disco; sem ela, o
+    conteúdo só é entregue ao chamador. O estado de sincronização avança
+    apenas quando o gerador é consumido até o fim. `vistos` (set de hashes)
+    evita entregar o mesmo conteúdo duas vezes na mesma execução; com
+    reprocessar, PDFs já extraídos voltam a ser entregues (backfill).
+
+    Yields:
+        tuple: (nome do arquivo, conteúdo em bytes)
+    """
+    mailbox.folder.set(pasta)
+
+    chave = f"{email}|{pasta}|{palavra_chave or '*'}"
+    estado = carregar_estado_sync() if incremental else {}
+    criterio, ultimo_uid, status = _criterio_busca(mailbox, pasta, estado.get(chave), data_limite)
+
+    # "N:*" sempre devolve ao menos a última mensagem, mesmo já processada
+    uids = [uid for uid in mailbox.uids(criterio) if int(uid) > ultimo_uid]
+    maior_uid = max([ultimo_uid, status['UIDNEXT'] - 1, *map(int, uids)])
+    logger.info(f"📬 {len(uids)} emails novos para analisar")
+    vistos = set() if vistos is None else vistos
+    uids_com_falha = []
+
+    # Fase 1: só a estrutura MIME e alguns cabeçalhos
+    for resposta in _buscar_itens(mailbox, uids, ITENS_ESTRUTURA):
+        partes = [
+            parte for parte in _partes_pdf(resposta.get('BODYSTRUCTURE'))
+            if not palavra_chave or palavra_chave.lower() in parte['nome'].lower()
+        ]
+        if not partes:
+            continue
+
+        cabecalhos = _cabecalhos(resposta)
+        logger.info(f"📩 Processando email: {cabecalhos['assunto']} - {cabecalhos['data']}")
+
+        # Fase 2: só as partes PDF selecionadas
+        itens = " ".join(f"BODY.PEEK[{parte['secao']}]" for parte in partes)
+        conteudo = next(_buscar_itens(mailbox, [resposta['UID']], f"(UID {itens})"), {})
+
+        for parte in partes:
+            try:
+                payload = _decodificar_parte(conteudo.pop(f"BODY[{parte['secao']}]"), parte['encoding'])
+                sha256 = sha256_bytes(payload)
+
+                with _trava_manifesto, manifesto() as conn:
+                    # Mesmo relatório reenviado (com qualquer nome): não processar de novo
+                    existente = buscar_no_manifesto(sha256, conn)
+                    if sha256 in vistos or _ja_processado(existente, reprocessar, em_disco=bool(pasta_destino)):
+                        logger.info(f"⏭️ PDF já baixado: {parte['nome']} (= {existente['nome_arquivo']})")
+                        continue
+
+                    filepath = None
+                    if pasta_destino:
+                        filepath = _caminho_livre(pasta_destino, parte['nome'], sha256)
+                        _gravar_atomico(filepath, payload)
+                        logger.info(f"📥 Baixado: {os.path.basename(filepath)}")
+                    registrar_pdf(sha256, parte['nome'], filepath, cabecalhos['message_id'], pasta, conn)
+                    vistos.add(sha256)
+            except Exception as e:
+                logger.error(f"❌ Erro ao salvar {parte['nome']}: {str(e)}")
+                uids_com_falha.append(int(resposta['UID']))
+                continue
+
+            yield parte['nome'], payload
+            del payload
+
+        # Liberar o conteúdo desta mensagem antes de seguir para a próxima
+        del conteudo
+
+    if uids_com_falha:
+        # O estado para antes da primeira mensagem com falha: ela (e as seguintes)
+        # voltam na próxima execução; as já baixadas são puladas pelo manifesto
+        maior_uid = min(maior_uid, min(uids_com_falha) - 1)
+        logger.warning(f"⚠️ {len(uids_com_falha)} PDFs com falha em {pasta}; serão buscados de novo")
+
+    if incremental:
+        # Só avança o estado depois de processar tudo (falhas são refeitas)
+        with _trava_estado:
+            estado = carregar_estado_sync()
+            estado[chave] = {'uidvalidity': status['UIDVALIDITY'], 'ultimo_uid': maior_uid}
+            salvar_estado_sync(estado)
+
+def _baixar_pdfs_pasta(mailbox, email, pasta, data_limite, palavra_chave=None, incremental=True, pasta_destino=None,
+                       reprocessar=False):
+    """
+    Baixa para o disco os PDFs novos de uma pasta
+
+    Returns:
+        int: quantidade de PDFs baixados
+    """
+    pasta_destino = pasta_destino or PASTA_DESTINO
+    os.makedirs(pasta_destino, exist_ok=True)
+    pdfs = _iterar_pdfs_pasta(
+        mailbox, email, pasta, data_limite, palavra_chave, incremental, pasta_destino, reprocessar=reprocessar
+    )
+    return sum(1 for _ in pdfs)
+
+def baixar_pdfs_gmail(dias_anteriores=7, pasta_especifica=None, incremental=True, pasta_destino=None):
     """
     Baixa PDFs do Gmail
     
     Args:
         dias_anteriores (int): Quantos dias para trás buscar emails (padrão: 7)
+            na primeira sincronização da pasta
         pasta_especifica (str): Nome da pasta/label específica (opcional)
+        incremental (bool): Buscar apenas mensagens com UID maior que o último
+            processado (padrão: True)
+        pasta_destino (str): Onde gravar os PDFs (padrão: PASTA_PDFS ou pdfs_baixados)
     """
     try:
         EMAIL = os.getenv("GMAIL_EMAIL")
         APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
-        PASTA_DESTINO = r"C:\Users\durva\OneDrive\Área de Trabalho\Projeto\data"
         
         if not EMAIL or not APP_PASSWORD:
             logger.error("❌ Credenciais não encontradas no .env")
             return False
             
-        # Garantir que a pasta destino existe
-        os.makedirs(PASTA_DESTINO, exist_ok=True)
-        
         logger.info(f"🔍 Conectando ao Gmail: {EMAIL}")
         
         with MailBox("imap.gmail.com").login(EMAIL, APP_PASSWORD) as mailbox:
             
             # Definir pasta para buscar
+            pasta = "INBOX"
             if pasta_especifica:
-                try:
-                    mailbox.folder.set(pasta_especifica)
-                    logger.info(f"📂 Buscando na pasta: {pasta_especifica}")
-                except:
+                if mailbox.folder.exists(pasta_especifica):
+                    pasta = pasta_especifica
+                else:
                     logger.warning(f"⚠️ Pasta '{pasta_especifica}' não encontrada, usando INBOX")
-                    mailbox.folder.set("INBOX")
-            else:
-                mailbox.folder.set("INBOX")
-                logger.info("📂 Buscando na pasta: INBOX")
+            logger.info(f"📂 Buscando na pasta: {pasta}")
             
             # Data limite para busca
             data_limite = datetime.now() - timedelta(days=dias_anteriores)
-            logger.info(f"📅 Buscando emails desde: {data_limite.strftime('%d/%m/%Y')}")
-            
-            # Buscar emails com anexos
-            criterio = AND(date_gte=data_limite.date())
-            emails = list(mailbox.fetch(criterio))
-            
-            # Filtrar apenas emails com anexos
-            emails_com_anexos = [msg for msg in emails if msg.attachments]
-            
-            logger.info(f"📧 Encontrados {len(emails_com_anexos)} emails com anexos")
             
-            pdfs_baixados = 0
-            
-            for msg in emails_com_anexos:
-                logger.info(f"📩 Processando email: {msg.subject} - {msg.date}")
-                
-                for att in msg.attachments:
-                    if att.filename and att.filename.lower().endswith(".pdf"):
-                        filepath = os.path.join(PASTA_DESTINO, att.filename)
-                        
-                        # Verificar se arquivo já existe
-                        if os.path.exists(filepath):
-                            logger.info(f"⏭️ Arquivo já existe: {att.filename}")
-                            continue
-                            
-                        try:
-                            with open(filepath, 'wb') as f:
-                                f.write(att.payload)
-                            logger.info(f"📥 Baixado: {att.filename}")
-                            pdfs_baixados += 1
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao salvar {att.filename}: {str(e)}")
+            pdfs_baixados = _baixar_pdfs_pasta(
+                mailbox, EMAIL, pasta, data_limite,
+                incremental=incremental, pasta_destino=pasta_destino
+            )
             
             logger.info(f"✅ Processo concluído! {pdfs_baixados} PDFs baixados")
             return True
@@ -114,47 +540,31 @@ def baixar_pdfs_gmail(dias_anteriores=7, pasta_especifica=None):
         logger.error(f"❌ Erro geral: {str(e)}")
         return False
 
-def buscar_pdfs_relatorio(palavra_chave="RDS"):
+def buscar_pdfs_relatorio(palavra_chave="RDS", incremental=True, pasta_destino=None):
     """
     Busca especificamente por PDFs de relatório contendo palavra-chave no nome
     
     Args:
         palavra_chave (str): Palavra-chave para filtrar PDFs (padrão: "RDS")
+        incremental (bool): Buscar apenas mensagens com UID maior que o último
+            processado (padrão: True)
+        pasta_destino (str): Onde gravar os PDFs (padrão: PASTA_PDFS ou pdfs_baixados)
     """
     try:
         EMAIL = os.getenv("GMAIL_EMAIL")
         APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
-        PASTA_DESTINO = r"C:\Users\durva\OneDrive\Área de Trabalho\Projeto\data"
         
         logger.info(f"🔍 Buscando PDFs contendo '{palavra_chave}' no nome...")
         
         with MailBox("imap.gmail.com").login(EMAIL, APP_PASSWORD) as mailbox:
-            mailbox.folder.set("INBOX")
-            
             # Buscar emails dos últimos 30 dias
             data_limite = datetime.now() - timedelta(days=30)
-            criterio = AND(date_gte=data_limite.date())
             
-            emails = list(mailbox.fetch(criterio))
-            pdfs_encontrados = 0
-            
-            for msg in emails:
-                if not msg.attachments:  # Pular emails sem anexos
-                    continue
-                for att in msg.attachments:
-                    if (att.filename and 
-                        att.filename.lower().endswith(".pdf") and 
-                        palavra_chave.lower() in att.filename.lower()):
-                        
-                        filepath = os.path.join(PASTA_DESTINO, att.filename)
-                        
-                        if not os.path.exists(filepath):
-                            with open(filepath, 'wb') as f:
-                                f.write(att.payload)
-                            logger.info(f"📥 Baixado relatório: {att.filename}")
-                            pdfs_encontrados += 1
-                        else:
-                            logger.info(f"⏭️ Relatório já existe: {att.filename}")
+            pdfs_encontrados = _baixar_pdfs_pasta(
+                mailbox, EMAIL, "INBOX", data_limite,
+                palavra_chave=palavra_chave, incremental=incremental,
+                pasta_destino=pasta_destino
+            )
             
             logger.info(f"✅ {pdfs_encontrados} relatórios novos baixados")
             return True
@@ -163,7 +573,134 @@ def buscar_pdfs_relatorio(palavra_chave="RDS"):
         logger.error(f"❌ Erro ao buscar relatórios: {str(e)}")
         return False
 
+def fontes_configuradas():
+    """
+    Fontes de email a sincronizar (variável EMAIL_FONTES, JSON)
+    
+    Cada fonte é um dict com 'pasta' e opcionalmente 'palavra_chave', 'email'
+    e 'senha_env' (nome da variável com a senha de app, para uma segunda conta).
+    Sem configuração, usa só a INBOX da conta padrão.
+    
+    Exemplo: [{"pasta": "RDS", "palavra_chave": "RDS"}, {"pasta": "Chart"}]
+    """
+    try:
+        fontes = json.loads(os.getenv("EMAIL_FONTES", "") or "[]")
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ EMAIL_FONTES inválido: {str(e)}")
+        fontes = []
+    return fontes or [{'pasta': 'INBOX'}]
+
+@contextmanager
+def _sessao_fonte(fonte):
+    """Abre a sessão IMAP de uma fonte; devolve (mailbox, email, pasta)"""
+    email = fonte.get('email') or os.getenv("GMAIL_EMAIL")
+    senha = os.getenv(fonte.get('senha_env', "GMAIL_APP_PASSWORD"))
+    pasta = fonte.get('pasta', 'INBOX')
+    if not email or not senha:
+        raise ValueError("credenciais não encontradas")
+
+    with MailBox(fonte.get('servidor', "imap.gmail.com")).login(email, senha) as mailbox:
+        if not mailbox.folder.exists(pasta):
+            raise ValueError(f"pasta '{pasta}' não encontrada")
+        yield mailbox, email, pasta
+
+def _sincronizar_fonte(fonte, dias_anteriores, incremental, pasta_destino, reprocessar=False):
+    """Sincroniza uma fonte (conta + pasta) na sua própria sessão IMAP"""
+    email = fonte.get('email') or os.getenv("GMAIL_EMAIL")
+    resultado = {'fonte': f"{email}/{fonte.get('pasta', 'INBOX')}", 'pdfs': 0, 'segundos': 0.0, 'sucesso': False}
+
+    inicio = time.perf_counter()
+    try:
+        with _sessao_fonte(fonte) as (mailbox, email, pasta):
+            data_limite = datetime.now() - timedelta(days=dias_anteriores)
+            resultado['pdfs'] = _baixar_pdfs_pasta(
+                mailbox, email, pasta, data_limite,
+                palavra_chave=fonte.get('palavra_chave'), incremental=incremental,
+                pasta_destino=pasta_destino, reprocessar=reprocessar
+            )
+        resultado['sucesso'] = True
+    except Exception as e:
+        resultado['erro'] = str(e)
+        logger.error(f"❌ Erro em {resultado['fonte']}: {str(e)}")
+    resultado['segundos'] = time.perf_counter() - inicio
+    return resultado
+
+def sincronizar_fontes(fontes=None, dias_anteriores=7, incremental=True, max_workers=4, pasta_destino=None,
+                       reprocessar=False):
+    """
+    Sincroniza várias pastas/contas em paralelo, uma sessão IMAP por fonte
+    
+    Todas gravam na mesma pasta destino e no mesmo manifesto; o tempo total
+    fica próximo ao da fonte mais lenta em vez da soma.
+    
+    Args:
+        fontes (list): Fontes (ver fontes_configuradas); padrão: EMAIL_FONTES
+        dias_anteriores (int): Janela da primeira sincronização de cada pasta
+        incremental (bool): Buscar apenas UIDs novos
+        max_workers (int): Máximo de sessões IMAP simultâneas
+        pasta_destino (str): Onde gravar os PDFs (padrão: PASTA_PDFS ou pdfs_baixados)
+        reprocessar (bool): Baixar de novo PDFs já extraídos que não estão em disco
+    
+    Returns:
+        list: Um dict por fonte com 'fonte', 'pdfs', 'segundos', 'sucesso'
+    """
+    fontes = fontes or fontes_configuradas()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(fontes)))) as executor:
+        futuros = [
+            executor.submit(_sincronizar_fonte, fonte, dias_anteriores, incremental, pasta_destino, reprocessar)
+            for fonte in fontes
+        ]
+        resultados = [futuro.result() for futuro in as_completed(futuros)]
+
+    for r in sorted(resultados, key=lambda r: r['fonte']):
+        icone = "✅" if r['sucesso'] else "❌"
+        logger.info(f"{icone} {r['fonte']}: {r['pdfs']} PDFs em {r['segundos']:.1f}s")
+    logger.info(f"⏱️ Sincronização de {len(fontes)} fontes em {time.perf_counter() - inicio:.1f}s")
+
+    return resultados
+
+def iterar_pdfs_gmail(fontes=None, dias_anteriores=7, incremental=True, reprocessar=False):
+    """
+    Entrega os PDFs novos direto da memória, sem gravar em disco
+    
+    Para alimentar a extração na mesma passada da sincronização. Os PDFs
+    entram no manifesto como 'baixado'; quem consome deve chamar
+    marcar_status(sha256_bytes(conteudo), STATUS_EXTRAIDO) após extrair.
+    
+    Args:
+        fontes (list): Fontes (ver fontes_configuradas); padrão: EMAIL_FONTES
+        dias_anteriores (int): Janela da primeira sincronização de cada pasta
+        incremental (bool): Buscar apenas UIDs novos
+        reprocessar (bool): Entregar também PDFs já extraídos (backfill)
+    
+    Yields:
+        tuple: (nome do arquivo, conteúdo em bytes)
+    """
+    vistos = set()
+    for fonte in fontes or fontes_configuradas():
+        try:
+            with _sessao_fonte(fonte) as (mailbox, email, pasta):
+                data_limite = datetime.now() - timedelta(days=dias_anteriores)
+                yield from _iterar_pdfs_pasta(
+                    mailbox, email, pasta, data_limite,
+                    palavra_chave=fonte.get('palavra_chave'), incremental=incremental,
+                    vistos=vistos, reprocessar=reprocessar
+                )
+        except ValueError as e:
+            logger.error(f"❌ Erro em {fonte.get('pasta', 'INBOX')}: {str(e)}")
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Testa a conexão e baixa PDFs do Gmail")
+    parser.add_argument("--destino", default=PASTA_DESTINO, help="Pasta onde gravar os PDFs (padrão: PASTA_PDFS ou pdfs_baixados)")
+    parser.add_argument("--dias", type=int, default=10, help="Janela da primeira sincronização (dias)")
+    parser.add_argument("--palavra-chave", default="RDS", help="Filtro do nome dos relatórios")
+    parser.add_argument("--completo", action="store_true", help="Ignorar o estado incremental e varrer a janela inteira")
+    args = parser.parse_args()
+
     print("🚀 Testando conexão e download de PDFs do Gmail...")
     
     # Teste 1: Conexão
@@ -171,12 +708,12 @@ if __name__ == "__main__":
         print("\n📁 Testando download de PDFs...")
         
         # Teste 2: Download geral
-        baixar_pdfs_gmail(dias_anteriores=10)
+        baixar_pdfs_gmail(dias_anteriores=args.dias, incremental=not args.completo, pasta_destino=args.destino)
         
-        print("\n📊 Buscando especificamente relatórios RDS...")
+        print(f"\n📊 Buscando especificamente relatórios {args.palavra_chave}...")
         
         # Teste 3: Relatórios específicos
-        buscar_pdfs_relatorio("RDS")
+        buscar_pdfs_relatorio(args.palavra_chave, incremental=not args.completo, pasta_destino=args.destino)
         
     else:
         print("❌ Falha na conexão. Verifique as credenciais.")
@@ -0,0 +1,300 @@
+"""
+Extração de dados dos relatórios PDF (RDS e Chart)
+Projeto: relatorioAram
+"""
+
+import io
+import re
+import logging
+import unicodedata
+from typing import Dict, List, Optional, Tuple, Union
+import pdfplumber
+
+logger = logging.getLogger(__name__)
+
+# Versão das regras de extração: incrementar sempre que a saída de algum
+# extrator mudar, para invalidar o cache de extração (utils/ingestao.py)
+EXTRATOR_VERSAO = 4
+
+# Caminho do arquivo ou conteúdo já em memória
+OrigemPdf = Union[str, bytes]
+
+_DATA = re.compile(r'(\d{2}/\d{2}/\d{4})')
+_NUMERO = r'(-?\d[\d\.]*(?:,\d+)?)'
+
+# Rótulos do RDS -> coluna de rds_vendas (primeiro número após o rótulo)
+CAMPOS_RDS = {
+    'valor_total': re.compile(r'TOTAL\s+(?:GERAL|DE\s+VENDAS|VENDAS)\D*?' + _NUMERO, re.IGNORECASE),
+    'valor_eventos': re.compile(r'EVENTOS\D*?' + _NUMERO, re.IGNORECASE),
+    'pax_hoje': re.compile(r'PAX\D*?' + _NUMERO, re.IGNORECASE),
+    'ocupacao_hoje': re.compile(r'OCUPA[ÇC][ÃA]O\D*?' + _NUMERO, re.IGNORECASE),
+    'diaria_media_uh': re.compile(r'DI[ÁA]RIA\s+M[ÉE]DIA\D*?' + _NUMERO, re.IGNORECASE),
+}
+CAMPOS_INTEIROS_RDS = {'pax_hoje'}
+
+_DIA_REFERENCIA = re.compile(r'DIA\s*(?:DE\s+REFER[ÊE]NCIA)?\s*:?\s*(\d{2}/\d{2}/\d{4})', re.IGNORECASE)
+
+def numero_br(texto) -> Optional[float]:
+    """
+    Converte número no formato brasileiro ('1.234,56', 'R$ 10,5', '85,3%')
+    """
+    if texto is None:
+        return None
+    texto = re.sub(r'[^\d,\.\-]', '', str(texto))
+    if not texto or texto in ('-', ',', '.'):
+        return None
+    try:
+        return float(texto.replace('.', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+def _abrir(pdf: OrigemPdf):
+    """Abre o PDF a partir do caminho ou dos bytes em memória"""
+    return pdfplumber.open(io.BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf)
+
+def _normalizar(texto: str) -> str:
+    """Maiúsculas sem acentos, para comparar âncoras ('Ocupação' == 'OCUPACAO')"""
+    texto = unicodedata.normalize('NFKD', texto.upper())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+# ---------------------------------------------------------------------------
+# Regiões dos relatórios: em vez de extrair todas as páginas inteiras, localiza
+# a página/faixa da tabela por texto-âncora e extrai só o recorte. A página da
+# âncora fica em cache por layout (tipo, nº de páginas, tamanho da página), então
+# relatórios do mesmo formato não varrem as páginas anteriores; os limites da
+# faixa são sempre recalculados, pois o número de linhas muda a cada relatório.
+# ---------------------------------------------------------------------------
+
+MARGEM_REGIAO = 4
+
+# Âncora que identifica a página, rótulos que delimitam a faixa e âncora de fim
+LAYOUT_RDS = {'ancora': 'OCUPACAO', 'rotulos': ('TOTAL', 'EVENTOS', 'PAX', 'OCUPACAO', 'DIARIA'), 'fim': None}
+LAYOUT_CHART = {'ancora': 'COMPRADOR', 'rotulos': ('COMPRADOR',), 'fim': 'TOTAL'}
+
+# assinatura do layout -> índice da página onde a âncora foi encontrada
+_templates: Dict[tuple, int] = {}
+
+def _assinatura(tipo: str, documento) -> tuple:
+    primeira = documento.pages[0]
+    return (tipo, len(documento.pages), round(primeira.width), round(primeira.height))
+
+def _palavras_com(palavras: list, textos) -> list:
+    """Palavras iguais a algum dos textos (sem acento, ignorando ':' no fim)"""
+    return [p for p in palavras if _normalizar(p['text']).rstrip(':') in textos]
+
+def _detectar_regioes(documento, layout: dict, primeira: int = 0) -> List[Tuple[int, tuple]]:
+    """Procura a âncora página a página (a partir de `primeira`) e devolve as faixas a extrair"""
+    regioes = []
+    for indice in range(primeira, len(documento.pages)):
+        pagina = documento.pages[indice]
+        palavras = pagina.extract_words()
+        topo, inicio_tabela = 0, 0
+
+        if not regioes:
+            rotulos = _palavras_com(palavras, layout['rotulos'])
+            ancoras = _palavras_com(rotulos, (layout['ancora'],))
+            if not ancoras:
+                continue
+            topo = max(min(p['top'] for p in rotulos) - MARGEM_REGIAO, 0)
+            inicio_tabela = ancoras[0]['bottom']
+            if not layout['fim']:
+                base = min(max(p['bottom'] for p in rotulos) + MARGEM_REGIAO, pagina.height)
+                return [(indice, (0, topo, pagina.width, base))]
+
+        # Tabela que pode continuar nas páginas seguintes até a linha de fim
+        fim = [p for p in _palavras_com(palavras, (layout['fim'],)) if p['top'] > inicio_tabela]
+        base = min(fim[0]['bottom'] + MARGEM_REGIAO, pagina.height) if fim else pagina.height
+        regioes.append((indice, (0, topo, pagina.width, base)))
+        if fim:
+            break
+    return regioes
+
+def _regioes(tipo: str, documento, layout: dict) -> List[Tuple[int, tuple]]:
+    """
+    Faixas a extrair; com template, a detecção começa na página já conhecida
+
+    Só o índice da página é reaproveitado: rótulos e linha de fim são
+    localizados de novo em cada documento.
+    """
+    assinatura = _assinatura(tipo, documento)
+    indice = _templates.get(assinatura)
+    if indice is not None:
+        regioes = _detectar_regioes(documento, layout, primeira=indice)
+        if regioes and regioes[0][0] == indice:
+            return regioes
+
+    regioes = _detectar_regioes(documento, layout)
+    if regioes:
+        _templates[assinatura] = regioes[0][0]
+    return regioes
+
+def _recortes(documento, regioes: List[Tuple[int, tuple]]) -> list:
+    return [documento.pages[indice].crop(bbox) for indice, bbox in regioes]
+
+def _texto_cabecalho(documento, regioes: List[Tuple[int, tuple]]) -> str:
+    """Texto acima da primeira região (onde ficam data e dia de referência)"""
+    indice, (_, topo, largura, _) = regioes[0]
+    pagina = documento.pages[indice]
+    if topo > 0:
+        texto = pagina.crop((0, 0, largura, topo)).extract_text() or ""
+        if _DATA.search(texto):
+            return texto
+    return pagina.extract_text() or ""
+
+def extrair_dados_rds(pdf: OrigemPdf) -> List[dict]:
+    """
+    Extrai a linha diária de rds_vendas de um relatório RDS
+
+    Args:
+        pdf: Caminho do arquivo ou conteúdo em bytes
+
+    Returns:
+        list: [dict com data, valor_total, valor_eventos, pax_hoje,
+              ocupacao_hoje, diaria_media_uh] ou [] se a data não for encontrada
+
+    Raises:
+        ValueError: Se algum indicador não for reconhecido (a linha gravada
+            substituiria a do mesmo dia com campos nulos)
+    """
+    with _abrir(pdf) as documento:
+        regioes = _regioes('rds', documento, LAYOUT_RDS)
+        if not regioes:
+            logger.warning("⚠️ RDS sem a tabela de indicadores")
+            return []
+        cabecalho = _texto_cabecalho(documento, regioes)
+        texto = "\n".join(recorte.extract_text() or "" for recorte in _recortes(documento, regioes))
+
+    data = _DATA.search(cabecalho) or _DATA.search(texto)
+    if not data:
+        logger.warning("⚠️ RDS sem data reconhecível")
+        return []
+
+    linha = {'data': data.group(1)}
+    for coluna, padrao in CAMPOS_RDS.items():
+        encontrado = padrao.search(texto)
+        valor = numero_br(encontrado.group(1)) if encontrado else None
+        if valor is not None and coluna in CAMPOS_INTEIROS_RDS:
+            valor = int(valor)
+        linha[coluna] = valor
+
+    faltando = [coluna for coluna in CAMPOS_RDS if linha[coluna] is None]
+    if faltando:
+        raise ValueError(f"RDS {linha['data']}: indicadores não reconhecidos: {', '.join(faltando)}")
+    return [linha]
+
+def _linha_comprador(celulas: list) -> Optional[Tuple[str, List[int]]]:
+    """(comprador, números da linha) de uma linha de tabela do Chart"""
+    textos = [str(c).strip() for c in celulas if c is not None and str(c).strip()]
+    if len(textos) < 2:
+        return None
+    numeros = [numero_br(t) for t in textos[1:]]
+    numeros = [int(n) for n in numeros if n is not None]
+    if not numeros or not re.search(r'[^\W\d_]', textos[0]):  # nome precisa ter letras
+        return None
+    return " ".join(textos[0].upper().split()), numeros
+
+def _linhas_texto(texto: str, max_numeros: int = 2) -> List[list]:
+    """
+    Linhas do texto como células: nome + até max_numeros números finais
+    (tabelas sem bordas; o limite preserva nomes que terminam em número)
+    """
+    linhas = []
+    for linha in texto.splitlines():
+        tokens = linha.split()
+        i = len(tokens)
+        while i > max(len(tokens) - max_numeros, 0) and numero_br(tokens[i - 1]) is not None and re.fullmatch(r'-?[\d\.,]+', tokens[i - 1]):
+            i -= 1
+        if 0 < i < len(tokens):
+            linhas.append([" ".join(tokens[:i])] + tokens[i:])
+    return linhas
+
+def extrair_dados_chart_com_totais_reais(pdf: OrigemPdf) -> List[dict]:
+    """
+    Extrai as linhas de chart_compradores_duplo de um relatório Chart
+
+    Cada comprador tem as reservas do dia de referência (primeira coluna
+    numérica) e o total real do período (última coluna). A linha TOTAL do
+    relatório não é gravada; serve só para conferir a soma.
+
+    Args:
+        pdf: Caminho do arquivo ou conteúdo em bytes
+
+    Returns:
+        list: dicts com data, comprador, total_reservas, reservas_dia, dia_referencia
+
+    Raises:
+        ValueError: Se a soma dos compradores diferir da linha TOTAL (leitura
+            incompleta não pode sobrescrever as linhas do dia)
+    """
+    linhas: Dict[str, dict] = {}
+    total_relatorio = None
+
+    with _abrir(pdf) as documento:
+        regioes = _regioes('chart', documento, LAYOUT_CHART)
+        if not regioes:
+            logger.warning("⚠️ Chart sem a tabela de compradores")
+            return []
+        cabecalho = _texto_cabecalho(documento, regioes)
+        data = _DATA.search(cabecalho)
+        if not data:
+            logger.warning("⚠️ Chart sem data reconhecível")
+            return []
+        referencia = _DIA_REFERENCIA.search(cabecalho)
+        dia_referencia = referencia.group(1) if referencia else data.group(1)
+
+        for recorte in _recortes(documento, regioes):
+            # Tabela com bordas quando houver; senão, linhas do texto
+            tabelas = recorte.extract_tables() or [_linhas_texto(recorte.extract_text() or "")]
+            for tabela in tabelas:
+                for celulas in tabela:
+                    linha = _linha_comprador(celulas)
+                    if not linha:
+                        continue
+                    comprador, numeros = linha
+                    if comprador.startswith('TOTAL'):
+                        total_relatorio = numeros[-1]
+                        continue
+                    linhas[comprador] = {
+                        'data': data.group(1),
+                        'comprador': comprador,
+                        'total_reservas': numeros[-1],
+                        'reservas_dia': numeros[0] if len(numeros) > 1 else 0,
+                        'dia_referencia': dia_referencia,
+                    }
+
+    soma = sum(l['total_reservas'] for l in linhas.values())
+    if total_relatorio is not None and soma != total_relatorio:
+        raise ValueError(
+            f"Chart {data.group(1)}: soma dos compradores ({soma}) difere do total do relatório ({total_relatorio})"
+        )
+
+    return list(linhas.values())
+
+# Tabela de destino -> (palavra-chave no nome do arquivo, extrator)
+EXTRATORES = {
+    'rds_vendas': ('RDS', extrair_dados_rds),
+    'chart_compradores_duplo': ('CHART', extrair_dados_chart_com_totais_reais),
+}
+
+def tabela_do_pdf(nome_arquivo: str) -> Optional[str]:
+    """Tabela de destino de um PDF pelo nome do arquivo (None se desconhecido)"""
+    nome = nome_arquivo.upper()
+    for tabela, (palavra_chave, _) in EXTRATORES.items():
+        if palavra_chave in nome:
+            return tabela
+    return None
+
+def extrair_pdf(nome_arquivo: str, pdf: OrigemPdf) -> Tuple[Optional[str], List[dict]]:
+    """
+    Extrai um PDF com o extrator correspondente ao nome
+
+    Função de módulo (sem estado) para poder rodar em ProcessPoolExecutor.
+
+    Returns:
+        tuple: (tabela de destino, linhas extraídas)
+    """
+    tabela = tabela_do_pdf(nome_arquivo)
+    if not tabela:
+        return None, []
+    _, extrator = EXTRATORES[tabela]
+    return tabela, extrator(pdf)
@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+import streamlit as st
 from datetime import datetime
 
 def formatar_data_br(data_str):
@@ -83,3 +85,142 @@ def formatar_percentual_br(valor):
         return f"{valor_formatado}%"
     except:
         return "N/A"
+
+MESES_BR = [
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
+]
+
+def formatar_mes_br(ano, mes):
+    """
+    Formata mês e ano: Agosto/2025
+    """
+    try:
+        return f"{MESES_BR[int(mes) - 1]}/{int(ano)}"
+    except:
+        return "N/A"
+
+# Versões para Series inteiras, com a mesma saída das funções acima: os
+# números são formatados no padrão americano e os separadores trocados de uma
+# vez só, num único texto com todos os valores. Ainda é uma formatação por
+# valor: só 1,0-1,5x mais rápido que Series.apply (ver o benchmark no fim do
+# arquivo); operações de texto do numpy (np.strings) ficaram mais lentas.
+# O ganho real é o de formatar_data_br_series (~20x), que formata cada data
+# distinta uma vez.
+
+_TROCA_SEPARADORES = str.maketrans(',.', '.,')
+
+def _formatar_series(valores, formato, prefixo='', sufixo=''):
+    """Formata uma Series numérica (NaN vira "N/A")"""
+    validos = valores.notna()
+    textos = "\n".join(f"{prefixo}{v:{formato}}{sufixo}" for v in valores[validos])
+    resultado = pd.Series("N/A", index=valores.index, dtype=object)
+    if validos.any():
+        resultado[validos] = textos.translate(_TROCA_SEPARADORES).split("\n")
+    return resultado
+
+def _numeros(serie):
+    """Series de floats; o que não for número vira NaN"""
+    serie = pd.Series(serie)
+    return pd.to_numeric(serie, errors='coerce').astype(float)
+
+def formatar_moeda_br_series(serie):
+    """
+    Versão vetorizada de formatar_moeda_br para uma Series
+    """
+    return _formatar_series(_numeros(serie), ',.2f', prefixo='R$ ')
+
+def formatar_numero_br_series(serie):
+    """
+    Versão vetorizada de formatar_numero_br para uma Series
+    """
+    valores = _numeros(serie)
+    # int(float(valor)) trunca em direção a zero (sem "-0") e recusa infinitos
+    truncados = np.trunc(valores) + 0.0
+    return _formatar_series(truncados.where(np.isfinite(truncados)), ',.0f')
+
+def formatar_percentual_br_series(serie):
+    """
+    Versão vetorizada de formatar_percentual_br para uma Series
+    """
+    return _formatar_series(_numeros(serie), '.1f', sufixo='%')
+
+def formatar_data_br_series(serie):
+    """
+    Versão vetorizada de formatar_data_br para uma Series
+
+    Datas se repetem muito: cada valor distinto é formatado uma única vez.
+    """
+    serie = pd.Series(serie)
+
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime('%d/%m/%Y').astype(object).where(serie.notna(), "N/A")
+
+    # Nulos recebem código -1, que aponta para o "N/A" no fim da lista
+    codigos, unicos = pd.factorize(serie)
+    formatados = np.array([formatar_data_br(v) for v in unicos] + ["N/A"], dtype=object)
+    return pd.Series(formatados[codigos], index=serie.index, dtype=object)
+
+# Formatos aplicados só na exibição: as colunas continuam numéricas
+# (ordenação correta no st.dataframe) e os separadores são trocados pelo
+# próprio Styler (thousands='.', decimal=',')
+FORMATO_MOEDA = "R$ {:,.2f}"
+FORMATO_NUMERO = "{:,.0f}"
+FORMATO_PERCENTUAL = "{:.1f}%"
+
+def estilo_tabela_br(df, moeda=(), numero=(), percentual=()):
+    """
+    Styler com formatação brasileira para exibir no st.dataframe
+
+    Args:
+        df (DataFrame): Dados com colunas numéricas
+        moeda (list): Colunas exibidas como R$ 1.234,56
+        numero (list): Colunas exibidas como 1.234
+        percentual (list): Colunas exibidas como 12,5%
+    """
+    formatos = {}
+    formatos.update({coluna: FORMATO_MOEDA for coluna in moeda})
+    formatos.update({coluna: FORMATO_NUMERO for coluna in numero})
+    formatos.update({coluna: FORMATO_PERCENTUAL for coluna in percentual})
+    return df.style.format(formatos, thousands='.', decimal=',', na_rep="N/A")
+
+def column_config_br(rotulos, datas=()):
+    """
+    column_config com rótulos das colunas e datas exibidas como dd/mm/aaaa
+    (formatadas no navegador, mantendo o tipo datetime)
+
+    Args:
+        rotulos (dict): coluna -> rótulo exibido
+        datas (list): Colunas datetime
+    """
+    config = {}
+    for coluna, rotulo in rotulos.items():
+        if coluna in datas:
+            config[coluna] = st.column_config.DateColumn(rotulo, format="DD/MM/YYYY")
+        else:
+            config[coluna] = st.column_config.Column(rotulo)
+    return config
+
+if __name__ == "__main__":
+    # Micro-benchmark: versões escalares (Series.apply) vs. vetorizadas
+    import timeit
+
+    n = 100_000
+    rng = np.random.default_rng(42)
+    valores = pd.Series(rng.uniform(-1e7, 1e7, n))
+    valores[::97] = np.nan
+    datas = pd.Series(pd.date_range('2020-01-01', periods=n, freq='h').strftime('%Y-%m-%d'))
+
+    casos = [
+        ("moeda", formatar_moeda_br, formatar_moeda_br_series, valores),
+        ("numero", formatar_numero_br, formatar_numero_br_series, valores),
+        ("percentual", formatar_percentual_br, formatar_percentual_br_series, valores),
+        ("data", formatar_data_br, formatar_data_br_series, datas),
+    ]
+
+    print(f"📏 {n} linhas")
+    for nome, escalar, vetorizada, serie in casos:
+        assert serie.apply(escalar).equals(vetorizada(serie)), nome
+        t_escalar = min(timeit.repeat(lambda: serie.apply(escalar), number=1, repeat=3))
+        t_vetorizada = min(timeit.repeat(lambda: vetorizada(serie), number=1, repeat=3))
+        print(f"{nome:>10}: apply {t_escalar:.3f}s | series {t_vetorizada:.3f}s | {t_escalar / t_vetorizada:.1f}x")
@@ -0,0 +1,323 @@
+"""
+Ingestão dos relatórios PDF no banco (extração em paralelo + gravação em lote)
+Projeto: relatorioAram
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Tuple
+from utils.extracao_pdf import EXTRATORES, EXTRATOR_VERSAO, OrigemPdf, extrair_pdf, tabela_do_pdf
+from utils.email_utils import (
+    PASTA_DESTINO, STATUS_BAIXADO, STATUS_ERRO, STATUS_EXTRAIDO, iterar_pdfs_gmail, manifesto, marcar_status,
+    pdfs_no_manifesto, remover_pdfs_extraidos, sha256_arquivo, sha256_bytes, sincronizar_fontes
+)
+from utils.database import get_watermark, migrar_esquema, upsert_data
+
+logger = logging.getLogger(__name__)
+
+# Cache de extração: (sha256 do PDF, versão do extrator) -> linhas extraídas
+ARQUIVO_CACHE_EXTRACAO = os.getenv("EXTRACAO_CACHE_DB", "extracao_cache.db")
+
+SQL_TABELA_CACHE = """
+CREATE TABLE IF NOT EXISTS cache_extracao (
+    sha256 TEXT NOT NULL,
+    versao INTEGER NOT NULL,
+    tabela TEXT NOT NULL,
+    linhas TEXT NOT NULL,
+    nome_arquivo TEXT,
+    criado_em TEXT NOT NULL,
+    PRIMARY KEY (sha256, versao)
+)
+"""
+
+@contextmanager
+def cache_extracao(caminho: Optional[str] = None):
+    """Abre o cache de extração (cria a tabela se preciso) e faz commit ao sair"""
+    conn = sqlite3.connect(caminho or ARQUIVO_CACHE_EXTRACAO, timeout=30)
+    try:
+        conn.execute(SQL_TABELA_CACHE)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+def _ler_cache(conn, sha256: str) -> Optional[Tuple[str, List[dict]]]:
+    linha = conn.execute(
+        "SELECT tabela, linhas FROM cache_extracao WHERE sha256 = ? AND versao = ?",
+        (sha256, EXTRATOR_VERSAO),
+    ).fetchone()
+    linhas = json.loads(linha[1]) if linha else None
+    # Entradas vazias gravadas antes da checagem abaixo contam como ausentes
+    return (linha[0], linhas) if linhas else None
+
+def _gravar_cache(conn, sha256: str, nome: str, tabela: str, linhas: List[dict]):
+    conn.execute(
+        "INSERT OR REPLACE INTO cache_extracao (sha256, versao, tabela, linhas, nome_arquivo, criado_em) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (sha256, EXTRATOR_VERSAO, tabela, json.dumps(linhas, ensure_ascii=False), nome,
+         datetime.now().isoformat(timespec='seconds')),
+    )
+
+def _sha256(pdf: OrigemPdf) -> str:
+    return sha256_bytes(pdf) if isinstance(pdf, (bytes, bytearray)) else sha256_arquivo(pdf)
+
+def _coletar(feitos, pendentes: dict, resultado: dict, conn):
+    """Junta as linhas dos PDFs já extraídos ao resultado e ao cache"""
+    for futuro in feitos:
+        nome, sha256 = pendentes.pop(futuro)
+        try:
+            tabela, linhas = futuro.result()
+            if not linhas:
+                # Layout não reconhecido: não cachear nem marcar como extraído
+                raise ValueError("nenhuma linha extraída")
+            resultado['linhas'][tabela].extend(linhas)
+            resultado['pdfs'] += 1
+            resultado['por_hash'][sha256] = tabela
+            _gravar_cache(conn, sha256, nome, tabela, linhas)
+            logger.info(f"📄 {nome}: {len(linhas)} linhas")
+        except Exception as e:
+            resultado['erros'].append((nome, str(e)))
+            resultado['por_hash'][sha256] = None
+            logger.error(f"❌ Erro ao extrair {nome}: {str(e)}")
+
+def extrair_em_paralelo(pdfs: Iterable[Tuple[str, OrigemPdf]], max_workers: Optional[int] = None,
+                        forcar: bool = False) -> dict:
+    """
+    Extrai vários PDFs em paralelo (pdfplumber é CPU-bound)
+
+    PDFs já extraídos pela versão atual do extrator (mesmo SHA-256) vêm do
+    cache de extração, sem reprocessar.
+
+    Args:
+        pdfs: Pares (nome do arquivo, caminho ou bytes); pode ser um gerador
+        max_workers: Processos simultâneos (padrão: número de CPUs)
+        forcar: Ignorar o cache e extrair tudo de novo
+
+    Returns:
+        dict: 'linhas' (tabela -> lista de linhas), 'pdfs', 'cache', 'erros',
+              'segundos' e 'por_hash' (sha256 -> tabela, ou None se falhou)
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    resultado = {
+        'linhas': {tabela: [] for tabela in EXTRATORES},
+        'pdfs': 0, 'cache': 0, 'erros': [], 'segundos': 0.0, 'por_hash': {},
+    }
+
+    inicio = time.perf_counter()
+    with cache_extracao() as conn, ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pendentes = {}
+        for nome, pdf in pdfs:
+            if not tabela_do_pdf(nome):
+                logger.info(f"⏭️ PDF sem extrator: {nome}")
+                continue
+
+            sha256 = _sha256(pdf)
+            em_cache = None if forcar else _ler_cache(conn, sha256)
+            if em_cache:
+                tabela, linhas = em_cache
+                resultado['linhas'][tabela].extend(linhas)
+                resultado['cache'] += 1
+                resultado['por_hash'][sha256] = tabela
+                continue
+
+            pendentes[executor.submit(extrair_pdf, nome, pdf)] = (nome, sha256)
+
+            # Limitar PDFs em voo (o gerador pode estar vindo direto do IMAP)
+            if len(pendentes) >= max_workers * 2:
+                feitos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                _coletar(feitos, pendentes, resultado, conn)
+
+        _coletar(list(pendentes), pendentes, resultado, conn)
+
+    resultado['segundos'] = time.perf_counter() - inicio
+    logger.info(
+        f"⏱️ {resultado['pdfs']} PDFs extraídos em {resultado['segundos']:.1f}s ({max_workers} processos), "
+        f"{resultado['cache']} do cache"
+    )
+    return resultado
+
+def ingerir_pdfs(pdfs: Iterable[Tuple[str, OrigemPdf]], max_workers: Optional[int] = None,
+                 forcar: bool = False) -> dict:
+    """
+    Extrai os PDFs em paralelo e grava cada tabela com um único upsert em lote
+
+    Returns:
+        dict: resultado da extração + 'gravacao' (tabela -> resultado do upsert)
+    """
+    resultado = extrair_em_paralelo(pdfs, max_workers, forcar)
+    resultado['gravacao'] = {}
+
+    for tabela, linhas in resultado['linhas'].items():
+        if not linhas:
+            continue
+        resultado['gravacao'][tabela] = upsert_data(tabela, linhas)
+
+    return resultado
+
+def pdfs_da_pasta(pasta: str = PASTA_DESTINO) -> Iterable[Tuple[str, str]]:
+    """Pares (nome, caminho) de todos os PDFs da pasta, recursivamente"""
+    for caminho in sorted(glob.glob(os.path.join(pasta, '**', '*.pdf'), recursive=True)):
+        yield os.path.basename(caminho), caminho
+
+def ingerir_pasta(pasta: str = PASTA_DESTINO, max_workers: Optional[int] = None, forcar: bool = False) -> dict:
+    """Ingere todos os PDFs de uma pasta (ex.: pdfs_baixados)"""
+    return ingerir_pdfs(pdfs_da_pasta(pasta), max_workers, forcar)
+
+# ---------------------------------------------------------------------------
+# Execução completa: python -m utils.ingestao
+# busca no Gmail -> deduplicação (manifesto) -> extração em paralelo (cache)
+# -> upsert em lote -> watermark
+# ---------------------------------------------------------------------------
+
+ARQUIVO_TRAVA = os.getenv("INGESTAO_LOCK", "ingestao.lock")
+VALIDADE_TRAVA_HORAS = 6
+
+@contextmanager
+def trava_execucao(caminho: str = ARQUIVO_TRAVA, validade_horas: float = VALIDADE_TRAVA_HORAS):
+    """
+    Impede duas ingestões simultâneas na mesma máquina/pasta
+
+    Uma trava mais velha que validade_horas é considerada abandonada
+    (processo morto) e é assumida.
+    """
+    try:
+        fd = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        idade = time.time() - os.path.getmtime(caminho)
+        if idade < validade_horas * 3600:
+            raise RuntimeError(f"Ingestão já em andamento (trava {caminho} de {idade / 60:.0f} min)")
+        logger.warning(f"⚠️ Trava abandonada há {idade / 3600:.1f}h, assumindo: {caminho}")
+        os.remove(caminho)
+        fd = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+
+    os.write(fd, f"{os.getpid()} {datetime.now().isoformat(timespec='seconds')}\n".encode())
+    os.close(fd)
+    try:
+        yield
+    finally:
+        os.remove(caminho)
+
+def _marcar_manifesto(resultado: dict):
+    """Marca no manifesto os PDFs extraídos e gravados (ou com erro)"""
+    gravou = {tabela: g['sucesso'] for tabela, g in resultado['gravacao'].items()}
+    with manifesto() as conn:
+        for sha256, tabela in resultado['por_hash'].items():
+            if tabela is None:
+                marcar_status(sha256, STATUS_ERRO, conn)
+            elif gravou.get(tabela, True):
+                marcar_status(sha256, STATUS_EXTRAIDO, conn)
+
+def executar(desde: Optional[date] = None, backfill: bool = False, em_memoria: bool = False,
+             pasta_local: Optional[str] = None, forcar_extracao: bool = False,
+             max_workers: Optional[int] = None) -> dict:
+    """
+    Ingestão completa em uma passada
+
+    Args:
+        desde: Varrer o email desde esta data, ignorando o estado incremental
+        backfill: Reingerir também PDFs já extraídos (usa o cache de extração)
+        em_memoria: Entregar os PDFs do IMAP direto à extração, sem gravar em
+            disco (mais rápido; falhas de gravação exigem nova execução com --desde)
+        pasta_local: Ingerir PDFs desta pasta em vez de buscar no email
+        forcar_extracao: Ignorar o cache de extração
+        max_workers: Processos de extração (padrão: número de CPUs)
+
+    Returns:
+        dict: resultado de ingerir_pdfs + 'fontes' e 'watermark'
+    """
+    dias = (date.today() - desde).days + 1 if desde else 7
+    incremental = desde is None
+    fontes = []
+
+    # Índices únicos, compradores e rollups antes de gravar (o app só lê)
+    try:
+        migrar_esquema()
+    except Exception as e:
+        logger.error(f"❌ Migração do banco falhou (gravando assim mesmo): {str(e)}")
+
+    if pasta_local:
+        pdfs = pdfs_da_pasta(pasta_local)
+    elif em_memoria:
+        pdfs = iterar_pdfs_gmail(dias_anteriores=dias, incremental=incremental, reprocessar=backfill)
+    else:
+        fontes = sincronizar_fontes(dias_anteriores=dias, incremental=incremental, reprocessar=backfill)
+        # Tudo o que está em disco e ainda não foi gravado no banco (inclui falhas anteriores)
+        status = None if backfill else (STATUS_BAIXADO, STATUS_ERRO)
+        pdfs = [(registro['nome_arquivo'], registro['caminho']) for registro in pdfs_no_manifesto(status)]
+        logger.info(f"📂 {len(pdfs)} PDFs para ingerir de {PASTA_DESTINO}")
+
+    resultado = ingerir_pdfs(pdfs, max_workers, forcar_extracao)
+    resultado['fontes'] = fontes
+    if not pasta_local:
+        _marcar_manifesto(resultado)
+
+    resultado['watermark'] = get_watermark()
+    logger.info(f"🔖 Watermark de ingestão: {resultado['watermark']}")
+    return resultado
+
+def _data_argumento(texto: str) -> date:
+    """Aceita AAAA-MM-DD ou DD/MM/AAAA"""
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"data inválida: {texto} (use AAAA-MM-DD ou DD/MM/AAAA)")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.ingestao",
+        description="Busca os relatórios no Gmail, extrai os PDFs e grava no banco"
+    )
+    parser.add_argument("--desde", "--since", dest="desde", type=_data_argumento,
+                        help="Varrer o email desde esta data (ignora o estado incremental)")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Reingerir também PDFs já extraídos (use com --desde)")
+    parser.add_argument("--em-memoria", action="store_true",
+                        help="Não gravar os PDFs em disco (uma passada só)")
+    parser.add_argument("--pasta", dest="pasta_local",
+                        help="Ingerir PDFs desta pasta em vez de buscar no email")
+    parser.add_argument("--forcar-extracao", action="store_true",
+                        help="Ignorar o cache de extração")
+    parser.add_argument("--processos", type=int, help="Processos de extração (padrão: nº de CPUs)")
+    parser.add_argument("--remover-extraidos", action="store_true",
+                        help="Ao final, apagar do disco os PDFs já extraídos (mantém só os pendentes)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        with trava_execucao():
+            resultado = executar(
+                desde=args.desde, backfill=args.backfill, em_memoria=args.em_memoria,
+                pasta_local=args.pasta_local, forcar_extracao=args.forcar_extracao,
+                max_workers=args.processos
+            )
+            if args.remover_extraidos:
+                remover_pdfs_extraidos()
+    except RuntimeError as e:
+        logger.error(f"❌ {str(e)}")
+        return 1
+
+    falhas = [f for f in resultado['fontes'] if not f['sucesso']]
+    falhas += [t for t, g in resultado['gravacao'].items() if not g['sucesso']]
+    for nome, erro in resultado['erros']:
+        logger.error(f"❌ {nome}: {erro}")
+    for tabela, gravacao in resultado['gravacao'].items():
+        if gravacao['sucesso']:
+            logger.info(f"✅ {tabela}: {gravacao['linhas']} linhas ({gravacao['linhas_por_segundo']:.0f} linhas/s)")
+        else:
+            logger.error(f"❌ {tabela}: gravação falhou: {gravacao.get('erro') or 'erro desconhecido'}")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,420 @@
+"""
+Camada de acesso a dados compartilhada pelas páginas do dashboard
+Projeto: relatorioAram
+
+Os loaders são cacheados (st.cache_data) pela chave do watermark de
+ingestão: mudar filtros na página refiltra os DataFrames em memória, e o
+banco só é consultado de novo quando um lote novo de dados é gravado.
+Falhas não entram no cache: as funções cacheadas propagam a exceção e os
+wrappers públicos a tratam.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from utils.database import (
+    consultar,
+    get_database_connection,
+    esquema_banco,
+    get_watermark,
+    periodo_mes,
+    primeira_tabela_existente,
+    registrar_ouvinte_ingestao,
+    tabela_existe,
+)
+from utils.compradores import CATEGORIAS_VENDAS_INTERNAS, classificar_comprador
+
+logger = logging.getLogger(__name__)
+
+# Poucas entradas bastam: versões antigas do watermark não são mais pedidas
+CACHE_MAX_ENTRADAS = 16
+
+# Segurança caso o watermark não avance (tabela ausente ou falha ao gravá-lo)
+CACHE_TTL_SEGUNDOS = 3 * 60 * 60
+
+COLUNAS_RDS = ['data', 'data_iso', 'valor_total', 'valor_eventos', 'pax_hoje', 'ocupacao_hoje', 'diaria_media_uh']
+
+# (início, fim) inclusivos; None = todo o histórico
+Periodo = Optional[Tuple[date, date]]
+
+def _filtros_periodo(periodo: Periodo) -> list:
+    """Filtros por faixa em data_iso (usam o índice)"""
+    if not periodo:
+        return []
+    inicio, fim = periodo
+    return [('data_iso', 'gte', inicio.isoformat()), ('data_iso', 'lte', fim.isoformat())]
+
+def _adicionar_data_dt(df: pd.DataFrame) -> pd.DataFrame:
+    if not df.empty:
+        df['data_dt'] = pd.to_datetime(df['data_iso'], format='%Y-%m-%d', errors='coerce')
+    return df
+
+def watermark_atual() -> int:
+    """
+    Lote de ingestão atual; consultar uma vez por rerun e repassar aos loaders
+    """
+    return get_watermark()
+
+def load_rds(periodo: Periodo = None, watermark: Optional[int] = None) -> pd.DataFrame:
+    """
+    Vendas RDS do período, ordenadas por data, com coluna data_dt (datetime)
+    """
+    try:
+        return _load_rds(periodo, watermark_atual() if watermark is None else watermark)
+    except Exception as e:
+        st.error(f"❌ Erro ao carregar vendas RDS: {str(e)}")
+        return pd.DataFrame()
+
+def load_chart(periodo: Periodo = None, watermark: Optional[int] = None) -> pd.DataFrame:
+    """
+    Reservas por comprador (Chart) do período
+
+    Usa chart_compradores_duplo quando disponível; senão a tabela antiga
+    chart_compradores, com `valor` exposto como total_reservas.
+    Colunas: data, data_iso, data_dt, comprador, total_reservas
+    """
+    try:
+        return _load_chart(periodo, watermark_atual() if watermark is None else watermark)
+    except Exception as e:
+        st.error(f"❌ Erro ao carregar compradores (Chart): {str(e)}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _load_rds(periodo: Periodo, watermark: int) -> pd.DataFrame:
+    rds = consultar(
+        'rds_vendas',
+        colunas=COLUNAS_RDS,
+        filtros=_filtros_periodo(periodo),
+        ordenar_por=[('data_iso', False)],
+        levantar_erro=True
+    )
+    return _adicionar_data_dt(rds)
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _load_chart(periodo: Periodo, watermark: int) -> pd.DataFrame:
+    filtros = _filtros_periodo(periodo)
+
+    # Fonte escolhida pelo registro do esquema: uma única consulta
+    tabela = primeira_tabela_existente(['chart_compradores_duplo', 'chart_compradores'], watermark)
+    if tabela is None:
+        return pd.DataFrame(columns=['data', 'data_iso', 'data_dt', 'comprador', 'total_reservas'])
+
+    coluna_total = 'total_reservas' if tabela == 'chart_compradores_duplo' else 'valor'
+    chart = consultar(
+        tabela,
+        colunas=['data', 'data_iso', 'comprador', coluna_total],
+        filtros=filtros,
+        ordenar_por=[('data_iso', False), (coluna_total, True)],
+        levantar_erro=True
+    ).rename(columns={coluna_total: 'total_reservas'})
+
+    return _adicionar_data_dt(chart)
+
+@dataclass
+class UltimoDia:
+    data: str
+    valor_total: Optional[float]
+    pax_hoje: Optional[int]
+    ocupacao_hoje: Optional[float]
+    valor_eventos: Optional[float]
+    diaria_media_uh: Optional[float]
+
+@dataclass
+class AcumuladoMes:
+    faturamento_mes: Optional[float]
+    vendas_mes: int
+    ocupacao_media: Optional[float]
+
+@dataclass
+class KpisResumo:
+    """
+    Números da página Resumo Geral para um mês
+
+    top_ota: ota_agencia, total_reservas, qtd_reservas (5 maiores)
+    vendas_internas: categoria_venda, total_reservas, reservas_dia_especifico
+    (nomes já no rótulo de exibição da dimensão compradores)
+    """
+    ultimo_dia: Optional[UltimoDia] = None
+    acumulado_mes: Optional[AcumuladoMes] = None
+    top_ota: pd.DataFrame = field(default_factory=pd.DataFrame)
+    vendas_internas: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+# Campos de cada seção na consulta única (colunas genéricas v1..v5 do UNION ALL)
+CAMPOS_KPIS = {
+    'ultimo_dia': ['data', 'valor_total', 'pax_hoje', 'ocupacao_hoje', 'valor_eventos', 'diaria_media_uh'],
+    'acumulado_mes': [None, 'faturamento_mes', 'vendas_mes', 'ocupacao_media'],
+    'top_ota': ['ota_agencia', 'total_reservas', 'qtd_reservas'],
+    'vendas_internas': ['categoria_venda', 'total_reservas', 'reservas_dia_especifico'],
+}
+
+# Seções da consulta única: tabelas necessárias, CTE e SELECT (colunas genéricas v1..v5)
+# Seções cujas tabelas não existem ficam de fora da instrução (ver esquema_banco)
+SECOES_KPIS = {
+    'ultimo_dia': (
+        ('rds_vendas',),
+        """ultimo AS (
+    SELECT data, valor_total, pax_hoje, ocupacao_hoje, valor_eventos, diaria_media_uh
+    FROM rds_vendas
+    ORDER BY data_iso DESC
+    LIMIT 1
+)""",
+        """SELECT 1 AS ordem, 'ultimo_dia' AS secao, data AS nome,
+       valor_total AS v1, pax_hoje AS v2, ocupacao_hoje AS v3, valor_eventos AS v4, diaria_media_uh AS v5
+FROM ultimo""",
+    ),
+    'acumulado_mes': (
+        ('rds_mensal',),
+        """acumulado AS (
+    SELECT faturamento_mes, vendas_mes, ocupacao_media FROM rds_mensal WHERE mes = :mes
+)""",
+        """SELECT 2 AS ordem, 'acumulado_mes' AS secao, NULL AS nome,
+       faturamento_mes AS v1, vendas_mes AS v2, ocupacao_media AS v3, NULL AS v4, NULL AS v5
+FROM acumulado""",
+    ),
+    'top_ota': (
+        ('chart_comprador_mensal', 'compradores'),
+        """top_ota AS (
+    SELECT COALESCE(d.rotulo, r.comprador) AS comprador, r.total_reservas, r.qtd_reservas
+    FROM chart_comprador_mensal r
+    LEFT JOIN compradores d ON d.id = r.comprador_id
+    WHERE r.mes = :mes
+    ORDER BY r.total_reservas DESC
+    LIMIT 5
+)""",
+        """SELECT 3 AS ordem, 'top_ota' AS secao, comprador AS nome,
+       total_reservas AS v1, qtd_reservas AS v2, NULL AS v3, NULL AS v4, NULL AS v5
+FROM top_ota""",
+    ),
+    'vendas_internas': (
+        ('chart_comprador_mensal', 'compradores'),
+        f"""internas AS (
+    SELECT d.rotulo AS comprador, SUM(r.total_reservas) AS total_reservas, SUM(r.reservas_dia) AS reservas_dia
+    FROM chart_comprador_mensal r
+    JOIN compradores d ON d.id = r.comprador_id
+    WHERE r.mes = :mes
+      AND d.categoria IN ({', '.join(f':categoria{i}' for i in range(len(CATEGORIAS_VENDAS_INTERNAS)))})
+    GROUP BY d.id, d.rotulo
+)""",
+        """SELECT 4 AS ordem, 'vendas_internas' AS secao, comprador AS nome,
+       total_reservas AS v1, reservas_dia AS v2, NULL AS v3, NULL AS v4, NULL AS v5
+FROM internas""",
+    ),
+}
+
+def sql_kpis_resumo(secoes: List[str]) -> str:
+    """Instrução única (CTEs + UNION ALL) com as seções informadas"""
+    ctes = [SECOES_KPIS[s][1] for s in secoes]
+    selects = [SECOES_KPIS[s][2] for s in secoes]
+    return (
+        "WITH " + ",\n".join(ctes) + "\n"
+        + "\nUNION ALL\n".join(selects)
+        + "\nORDER BY ordem, v1 DESC"
+    )
+
+def load_kpis_resumo(ano: int, mes: int, watermark: Optional[int] = None) -> KpisResumo:
+    """
+    Todos os números da página Resumo Geral em uma ida ao banco
+
+    SQLite: uma instrução com CTEs (sql_kpis_resumo), só com as seções
+    cujas tabelas existem.
+    Supabase: uma chamada RPC (SQL_MIGRACAO_KPIS_RESUMO_POSTGRES).
+    Se a consulta única falhar (ex.: SQL do Supabase ainda não aplicado),
+    cada seção é carregada separadamente a partir das tabelas de origem.
+    """
+    ano, mes = int(ano), int(mes)
+    watermark = watermark_atual() if watermark is None else watermark
+    try:
+        return _load_kpis_resumo(ano, mes, watermark)
+    except Exception as e:
+        logger.warning(f"⚠️ Consulta única do Resumo Geral falhou, carregando por seção: {str(e)}")
+        return _kpis_por_secao(ano, mes, watermark)
+
+def _primeira_linha(valor) -> Optional[dict]:
+    """Seção de linha única: lista de dicts (SQLite) ou objeto JSON (RPC do Supabase)"""
+    if isinstance(valor, list):
+        return valor[0] if valor else None
+    return valor or None
+
+def _linhas_para_kpis(secoes: dict) -> KpisResumo:
+    """Monta o resultado tipado a partir de secao -> linhas"""
+    ultimo = _primeira_linha(secoes.get('ultimo_dia'))
+    acumulado = _primeira_linha(secoes.get('acumulado_mes'))
+    return KpisResumo(
+        ultimo_dia=UltimoDia(**ultimo) if ultimo else None,
+        acumulado_mes=AcumuladoMes(**acumulado) if acumulado else None,
+        top_ota=pd.DataFrame(secoes.get('top_ota') or [], columns=CAMPOS_KPIS['top_ota']),
+        vendas_internas=pd.DataFrame(
+            secoes.get('vendas_internas') or [], columns=CAMPOS_KPIS['vendas_internas']
+        ),
+    )
+
+def _secoes_sqlite(conn, ano: int, mes: int, watermark: int) -> dict:
+    """Executa a consulta única e separa as linhas por seção"""
+    esquema = esquema_banco(watermark)
+    disponiveis = [
+        secao for secao, (tabelas, _, _) in SECOES_KPIS.items()
+        if all(t in esquema for t in tabelas)
+    ]
+    faltando = [secao for secao in SECOES_KPIS if secao not in disponiveis]
+    if faltando:
+        # Rollups/dimensão ainda não migrados: o chamador carrega por seção
+        raise LookupError(f"tabelas da consulta única ausentes para {', '.join(faltando)}")
+
+    params = {'mes': f"{ano:04d}-{mes:02d}"}
+    params.update({f'categoria{i}': c for i, c in enumerate(CATEGORIAS_VENDAS_INTERNAS)})
+
+    secoes = {}
+    for _, secao, nome, *valores in conn.execute(sql_kpis_resumo(disponiveis), params):
+        campos = CAMPOS_KPIS[secao]
+        linha = dict(zip(campos, [nome] + valores))
+        linha.pop(None, None)
+        secoes.setdefault(secao, []).append(linha)
+    return secoes
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _load_kpis_resumo(ano: int, mes: int, watermark: int) -> KpisResumo:
+    with get_database_connection() as db_conn:
+        if db_conn["type"] == "supabase":
+            secoes = db_conn["client"].rpc('kpis_resumo', {
+                'mes_ref': f"{ano:04d}-{mes:02d}",
+                'categorias': list(CATEGORIAS_VENDAS_INTERNAS),
+            }).execute().data or {}
+        else:
+            secoes = _secoes_sqlite(db_conn["client"], ano, mes, watermark)
+    return _linhas_para_kpis(secoes)
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _load_ultimo_dia(watermark: int) -> Optional[UltimoDia]:
+    ultimo = consultar(
+        'rds_vendas',
+        colunas=CAMPOS_KPIS['ultimo_dia'],
+        ordenar_por=[('data_iso', True)],
+        limite=1,
+        levantar_erro=True
+    )
+    return UltimoDia(**ultimo.iloc[0].to_dict()) if not ultimo.empty else None
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _load_acumulado_mes(ano: int, mes: int, watermark: int) -> Optional[AcumuladoMes]:
+    acumulado = consultar(
+        'rds_vendas',
+        filtros=periodo_mes(ano, mes),
+        agregados={
+            'faturamento_mes': ('sum', 'valor_total'),
+            'vendas_mes': ('count', '*'),
+            'ocupacao_media': ('avg', 'ocupacao_hoje')
+        },
+        levantar_erro=True
+    )
+    if acumulado.empty or not acumulado.iloc[0]['vendas_mes']:
+        return None
+    linha = acumulado.iloc[0]
+    return AcumuladoMes(
+        faturamento_mes=linha['faturamento_mes'],
+        vendas_mes=int(linha['vendas_mes']),
+        ocupacao_media=linha['ocupacao_media']
+    )
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _load_compradores_mes(ano: int, mes: int, watermark: int) -> pd.DataFrame:
+    """Reservas do mês por comprador, com categoria e rótulo da classificação"""
+    compradores = consultar(
+        'chart_compradores_duplo',
+        filtros=periodo_mes(ano, mes),
+        agregados={
+            'total_reservas': ('sum', 'total_reservas'),
+            'reservas_dia_especifico': ('sum', 'reservas_dia'),
+            'qtd_reservas': ('count', '*')
+        },
+        agrupar_por=['comprador'],
+        ordenar_por=[('total_reservas', True)],
+        levantar_erro=True
+    )
+    if compradores.empty:
+        return pd.DataFrame(columns=['comprador', 'total_reservas', 'reservas_dia_especifico',
+                                     'qtd_reservas', 'categoria', 'rotulo'])
+    classificacao = pd.DataFrame([classificar_comprador(n) for n in compradores['comprador']])
+    compradores['categoria'] = classificacao['categoria'].values
+    compradores['rotulo'] = classificacao['rotulo'].values
+    return compradores
+
+def _kpis_por_secao(ano: int, mes: int, watermark: int) -> KpisResumo:
+    """Cada seção por conta própria: a falha de uma não esconde as demais"""
+    kpis = KpisResumo()
+    try:
+        kpis.ultimo_dia = _load_ultimo_dia(watermark)
+    except Exception as e:
+        logger.warning(f"⚠️ Último dia indisponível: {str(e)}")
+    try:
+        kpis.acumulado_mes = _load_acumulado_mes(ano, mes, watermark)
+    except Exception as e:
+        logger.warning(f"⚠️ Acumulado do mês indisponível: {str(e)}")
+    try:
+        compradores = _load_compradores_mes(ano, mes, watermark)
+    except Exception as e:
+        logger.warning(f"⚠️ Compradores do mês indisponíveis: {str(e)}")
+        return kpis
+
+    kpis.top_ota = compradores.head(5).rename(columns={'rotulo': 'ota_agencia'})[CAMPOS_KPIS['top_ota']]
+    internas = compradores[compradores['categoria'].isin(CATEGORIAS_VENDAS_INTERNAS)]
+    kpis.vendas_internas = (
+        internas.groupby('rotulo', as_index=False, sort=False)[['total_reservas', 'reservas_dia_especifico']].sum()
+        .sort_values('total_reservas', ascending=False)
+        .rename(columns={'rotulo': 'categoria_venda'})
+        .reset_index(drop=True)
+    )
+    return kpis
+
+def load_meses_disponiveis(watermark: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Meses (ano, mês) com dados, mais recente primeiro; sem rollup, os últimos 12 meses
+    """
+    try:
+        meses = _load_meses_disponiveis(watermark_atual() if watermark is None else watermark)
+    except Exception as e:
+        logger.warning(f"⚠️ Meses disponíveis não carregados: {str(e)}")
+        meses = []
+    if meses:
+        return meses
+
+    hoje = datetime.now()
+    return [
+        (hoje.year + (hoje.month - 1 - i) // 12, (hoje.month - 1 - i) % 12 + 1)
+        for i in range(12)
+    ]
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _load_meses_disponiveis(watermark: int) -> List[Tuple[int, int]]:
+    if not tabela_existe('rds_mensal', watermark):
+        return []
+    meses = consultar('rds_mensal', colunas=['mes'], ordenar_por=[('mes', True)], levantar_erro=True)
+    return [(int(m[:4]), int(m[5:7])) for m in meses['mes']]
+
+def filtrar_periodo(df: pd.DataFrame, inicio: date, fim: date) -> pd.DataFrame:
+    """
+    Recorta um DataFrame carregado pelos loaders (coluna data_dt) em memória
+    """
+    if df.empty:
+        return df
+    mask = (df['data_dt'] >= pd.Timestamp(inicio)) & (df['data_dt'] <= pd.Timestamp(fim))
+    return df[mask]
+
+def invalidar_cache(tabela: Optional[str] = None):
+    """
+    Descarta os DataFrames cacheados; chamado após ingestões no mesmo processo
+    (ingestões externas são detectadas pelo watermark)
+    """
+    _load_rds.clear()
+    _load_chart.clear()
+    _load_kpis_resumo.clear()
+    _load_ultimo_dia.clear()
+    _load_acumulado_mes.clear()
+    _load_compradores_mes.clear()
+    _load_meses_disponiveis.clear()
+
+registrar_ouvinte_ingestao(invalidar_cache)